@@ -2,7 +2,10 @@ import apache_beam as beam
 from apache_beam.options.pipeline_options import PipelineOptions
 import subprocess
 import os
+import sys
+import time
 import datetime
+import math
 import pandas as pd
 import matplotlib.pyplot as plt
 import matplotlib
@@ -35,24 +38,144 @@ TEMP_DIR = "/tmp/dataflow_temp"
 # Docker image used for Dataflow workers, should contain LibreOffice, Python, etc.
 DOCKER_IMAGE = "gcr.io/scientific-elf-471213-d6/formats_converter:latest"
 
+# Image extensions routed to the image-to-PDF conversion
+IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.tif', '.tiff']
+
+# Minimum resolution kept for the images embedded in the PDFs; scans at two or more
+# times this resolution are reduced by an integer factor
+IMAGE_TARGET_DPI = 200
+
+# Page size (inches, A4) assumed for images without DPI information
+DEFAULT_PAGE_SIZE_INCHES = (8.27, 11.69)
+
+# Maximum pixels of a page image kept in memory after decoding; pages are written one at a time
+IMAGE_PIXEL_BUDGET = 24_000_000
+
+# Image sizes (megapixels) measured by `python formats_converter.py --benchmark-images`
+BENCHMARK_IMAGE_MEGAPIXELS = [2, 12, 24, 40]
+
 # ------------------ HELPER FUNCTIONS ---------------
 def get_storage_client():
     """Creates a Google Cloud Storage client."""
     return storage.Client()
 
+def _page_size_inches(size, dpi):
+    """Physical size of the image page, from its DPI or fitted to the default page."""
+    width, height = size
+    if dpi and dpi[0] > 1 and dpi[1] > 1:
+        # TIFF resolutions are rationals; the PDF writer needs floats
+        return width / float(dpi[0]), height / float(dpi[1])
+    page_w, page_h = sorted(DEFAULT_PAGE_SIZE_INCHES, reverse=width > height)
+    fit = min(page_w / width, page_h / height)
+    return width * fit, height * fit
+
+def _reduction_factor(size, page_inches):
+    """Largest integer reduction that keeps at least IMAGE_TARGET_DPI."""
+    return max(1, int(size[0] / (page_inches[0] * IMAGE_TARGET_DPI)))
+
+def _prepare_pdf_page(img, factor):
+    """Reduces a frame by `factor`, enforces IMAGE_PIXEL_BUDGET and converts it to a mode the PDF writer embeds.
+    Bilevel pages are reduced in grayscale and thresholded again, so that one-pixel strokes
+    survive the reduction instead of being dropped by nearest-neighbour sampling."""
+    over_budget = img.width * img.height > IMAGE_PIXEL_BUDGET
+    bilevel = img.mode == '1' and (factor >= 2 or over_budget)
+    if bilevel:
+        img = img.convert('L')
+    original_width = img.width
+
+    if factor >= 2:
+        reduced = (max(1, img.width // factor), max(1, img.height // factor))
+        # Box reduction by an integer factor is much cheaper than resampling
+        img = img.resize(reduced, Image.Resampling.NEAREST) if img.mode == 'P' else img.reduce(factor)
+
+    if img.width * img.height > IMAGE_PIXEL_BUDGET:
+        scale = (IMAGE_PIXEL_BUDGET / (img.width * img.height)) ** 0.5
+        img = img.resize((max(1, int(img.width * scale)), max(1, int(img.height * scale))),
+                         Image.Resampling.LANCZOS, reducing_gap=2.0)
+
+    if bilevel:
+        # A pixel stays black when at least half a source column of its block was black
+        block = original_width / img.width
+        cutoff = 255 * (1 - 1 / (2 * block))
+        img = img.point(lambda value: 255 if value > cutoff else 0, '1')
+
+    if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
+        # Transparent areas become white instead of black
+        rgba = img.convert('RGBA')
+        background = Image.new('RGB', rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.getchannel('A'))
+        return background
+    if img.mode not in ('1', 'L', 'RGB', 'CMYK'):
+        return img.convert('RGB')
+    return img
+
 def _convert_image_to_pdf(input_file, output_file):
-    """Converts an image file (JPG, PNG) to PDF."""
+    """Converts an image file (JPG, JPEG, PNG, TIF, TIFF) to PDF.
+    Pages are reduced by the largest integer factor that keeps IMAGE_TARGET_DPI and to at
+    most IMAGE_PIXEL_BUDGET pixels. JPEGs are already reduced at decode time, in draft mode,
+    by whichever of the two factors is larger, so the decoded page stays within the budget.
+    Multi-page TIFFs become multi-page PDFs, written one page at a time."""
     try:
-        img = Image.open(input_file)
-        if img.mode != 'RGB':
-            img = img.convert('RGB')
-        img.save(output_file, resolution=100.0)
-        print(f"[IMAGEM Converter] Converted {os.path.basename(input_file)} to PDF at {output_file}")
+        with Image.open(input_file) as img:
+            frames = getattr(img, 'n_frames', 1)
+            for index in range(frames):
+                img.seek(index)
+                page_inches = _page_size_inches(img.size, img.info.get('dpi'))
+                factor = _reduction_factor(img.size, page_inches)
+
+                budget_factor = math.ceil((img.width * img.height / IMAGE_PIXEL_BUDGET) ** 0.5)
+                draft_factor = max(factor, budget_factor)
+                if img.format == 'JPEG' and draft_factor >= 2:
+                    # Decodes at 1/2, 1/4 or 1/8 scale; the rest of the factor is applied by reduce()
+                    # and whatever still exceeds the budget by the resize in _prepare_pdf_page
+                    width = img.width
+                    img.draft(img.mode if img.mode in ('L', 'CMYK') else 'RGB',
+                              (-(-img.width // draft_factor), -(-img.height // draft_factor)))
+                    factor = max(1, factor * img.width // width)
+
+                page = _prepare_pdf_page(img, factor)
+                page.save(output_file, 'PDF', resolution=page.width / page_inches[0], append=index > 0)
+                if page is not img:
+                    page.close()
+
+        pages = f" ({frames} pages)" if frames > 1 else ""
+        print(f"[IMAGEM Converter] Converted {os.path.basename(input_file)}{pages} to PDF at {output_file}")
         return True
     except Exception as e:
         print(f"[IMAGEM Converter] Error converting image {os.path.basename(input_file)} to PDF: {e}")
         return False
 
+def benchmark_image_conversion(megapixels=None, repeats=3):
+    """Measures the image-to-PDF throughput per image size on synthetic 600 DPI scans,
+    comparing the full-resolution decode with the adaptive engine."""
+    os.makedirs(TEMP_DIR, exist_ok=True)
+    print(f"{'image':>12} {'engine':>10} {'s/image':>9} {'MP/s':>8} {'PDF (KB)':>9}")
+    for mp in megapixels or BENCHMARK_IMAGE_MEGAPIXELS:
+        height = int((mp * 1_000_000 / 0.707) ** 0.5)
+        width = int(height * 0.707)
+        input_path = os.path.join(TEMP_DIR, f"benchmark_{mp}mp.jpg")
+        output_path = os.path.join(TEMP_DIR, f"benchmark_{mp}mp.pdf")
+        scan = Image.merge('RGB', [Image.effect_noise((width, height), 40).point(lambda v, k=k: (v + k) % 256) for k in (0, 60, 120)])
+        scan.save(input_path, quality=90, dpi=(600, 600))
+        scan.close()
+
+        def full_decode(input_file, output_file):
+            img = Image.open(input_file)
+            if img.mode != 'RGB':
+                img = img.convert('RGB')
+            img.save(output_file, resolution=100.0)
+
+        for engine, convert in (('full', full_decode), ('adaptive', _convert_image_to_pdf)):
+            start = time.perf_counter()
+            for _ in range(repeats):
+                convert(input_path, output_path)
+            elapsed = (time.perf_counter() - start) / repeats
+            print(f"{f'{width}x{height}':>12} {engine:>10} {elapsed:>9.2f} {width * height / 1e6 / elapsed:>8.1f} "
+                  f"{os.path.getsize(output_path) / 1024:>9.0f}")
+
+        os.remove(input_path)
+        os.remove(output_path)
+
 def _convert_excel_to_pdf_matplotlib(input_file, output_file):
     """Converts an Excel file to PDF using Pandas and Matplotlib."""
     try:
@@ -465,7 +588,7 @@ def run():
         )
         jpg_png_files = (
             files_pcollection
-            | 'FilterJpgPng' >> beam.Filter(lambda f: f[3] in ['.jpg', '.png'])
+            | 'FilterJpgPng' >> beam.Filter(lambda f: f[3] in IMAGE_EXTENSIONS)
         )
         xlsx_files = (
             files_pcollection
@@ -526,5 +649,8 @@ def run():
         all_converted_files | 'UploadAndCleanGCS' >> beam.ParDo(UploadAndCleanGCS())
 
 if __name__ == '__main__':
-    run()
-    print("Conversion process completed!")
\ No newline at end of file
+    if '--benchmark-images' in sys.argv[1:]:
+        benchmark_image_conversion()
+    else:
+        run()
+        print("Conversion process completed!")
\ No newline at end of file
@@ -1,15 +1,19 @@
-import yaml
+import os
 import streamlit as st
 #from PIL import Image # Descomente para carregar a imagem
-from yaml.loader import SafeLoader
 import streamlit_authenticator as stauth
-from main import main as home_main
+from configuracao import atualizar_config, carregar_config, versao_config
+from metricas import iniciar_servidor_metricas, medir, turno
 from streamlit_authenticator.utilities import (
     CredentialsError, LoginError, RegisterError, ResetError, UpdateError
 )
 
 st.set_page_config(layout="wide")
 
+# Com METRICAS_PORTA definida, expõe /metrics (formato Prometheus) nessa porta
+if os.environ.get("METRICAS_PORTA"):
+    iniciar_servidor_metricas(int(os.environ["METRICAS_PORTA"]))
+
 st.markdown("""
 <style>
     #MainMenu {visibility: hidden;}
@@ -18,17 +22,23 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# ======== Funções utilitárias ========
-def carregar_config():
-    with open('./config_credential.yaml', 'r', encoding='utf-8') as file:
-        return yaml.load(file, Loader=SafeLoader)
+def salvar_usuario(username, dados=None):
+    # Grava apenas a alteração deste usuário (ou sua remoção, sem `dados`) sobre a
+    # configuração atual do arquivo, sem desfazer alterações feitas por outras sessões
+    def alterar(config_atual):
+        usuarios = config_atual['credentials']['usernames']
+        if dados is None:
+            usuarios.pop(username, None)
+        else:
+            usuarios[username] = dados
+
+    st.session_state['config'], st.session_state['versao_config'] = atualizar_config(alterar)
 
-def salvar_config(config):
-    with open('./config_credential.yaml', 'w', encoding='utf-8') as file:
-        yaml.dump(config, file, default_flow_style=False)
 
 # ======== Páginas ========
 def render_home():
+    # Importado só após o login: a página inicial não depende dos módulos do chat
+    from main import main as home_main
     home_main(authenticator)
 
 
@@ -37,7 +47,7 @@ def render_criar_usuario(authenticator, config):
         email, username, name = authenticator.register_user()
         if email:
             st.success('Usuário registrado com sucesso!')
-            salvar_config(config)  # Salvar após criação
+            salvar_usuario(username, config['credentials']['usernames'][username])  # Salvar após criação
     except RegisterError as e:
         st.error(e)
 
@@ -46,7 +56,7 @@ def render_resetar_senha(authenticator):
     try:
         if authenticator.reset_password(st.session_state['username']):
             st.success('Senha modificada com sucesso!')
-            salvar_config(config)
+            salvar_usuario(st.session_state['username'], config['credentials']['usernames'][st.session_state['username']])
     except (CredentialsError, ResetError) as e:
         st.error(e)
 
@@ -55,7 +65,7 @@ def render_atualizar_dados(authenticator):
     try:
         if authenticator.update_user_details(st.session_state['username']):
             st.success('Dados atualizados com sucesso!')
-            salvar_config(config)
+            salvar_usuario(st.session_state['username'], config['credentials']['usernames'][st.session_state['username']])
     except UpdateError as e:
         st.error(e)
 
@@ -76,14 +86,20 @@ def render_remover_usuario(config):
 
         if st.button("Remover Usuário"):
             del config['credentials']['usernames'][usuario_selecionado]
-            salvar_config(config)
+            salvar_usuario(usuario_selecionado)
             st.success(f"Usuário '{usuario_selecionado}' removido com sucesso!")
     except Exception as e:
         st.error(f"Ocorreu um erro ao tentar remover o usuário: {e}")
 
 
 # ======== Código principal ========
-config = carregar_config()
+# A configuração fica em cache no processo; a sessão só recarrega sua cópia
+# quando o arquivo foi alterado (por outra sessão ou externamente)
+versao_atual = versao_config()
+if st.session_state.get('versao_config') != versao_atual or 'config' not in st.session_state:
+    st.session_state['config'] = carregar_config()
+    st.session_state['versao_config'] = versao_atual
+config = st.session_state['config']
 authenticator = stauth.Authenticate(
     config['credentials'],
     config['cookie']['name'],
@@ -92,7 +108,9 @@ authenticator = stauth.Authenticate(
 )
 
 try:
-    authenticator.login()
+    # A autenticação roda a cada rerun, fora dos turnos do chat: cada uma tem o próprio id de correlação
+    with turno(), medir("autenticacao"):
+        authenticator.login()
 except LoginError as e:
     st.error(e)
 
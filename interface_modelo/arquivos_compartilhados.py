@@ -0,0 +1,63 @@
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: apenas o lock entre threads é aplicado
+    fcntl = None
+
+# Arquivos locais compartilhados pelos processos do app (configuração, fila de indexação,
+# acompanhamento das importações, índice local, limites de taxa): lock de arquivo entre
+# processos e gravação atômica.
+
+# Um lock entre threads por arquivo de lock: caminho absoluto -> [RLock, profundidade]
+_locks = {}
+_lock_registro = threading.Lock()
+
+
+@contextmanager
+def lock_arquivo(caminho):
+    # Lock exclusivo entre as threads do processo e, quando disponível, entre processos (flock).
+    # É reentrante na mesma thread: só a primeira entrada abre o arquivo e adquire o flock.
+    caminho = os.path.abspath(caminho)
+    with _lock_registro:
+        estado = _locks.setdefault(caminho, [threading.RLock(), 0])
+
+    with estado[0]:
+        estado[1] += 1
+        try:
+            if estado[1] > 1 or fcntl is None:
+                yield
+                return
+            os.makedirs(os.path.dirname(caminho), exist_ok=True)
+            with open(caminho, 'w') as arquivo_lock:
+                fcntl.flock(arquivo_lock, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(arquivo_lock, fcntl.LOCK_UN)
+        finally:
+            estado[1] -= 1
+
+
+def gravar_atomico(caminho, conteudo, sincronizar=True):
+    # Grava `conteudo` (bytes) num arquivo temporário do mesmo diretório e o renomeia sobre
+    # `caminho`: quem lê vê a versão anterior ou a nova, nunca um arquivo pela metade.
+    # Sem `sincronizar`, dispensa o fsync (para estado que pode ser perdido numa queda).
+    diretorio = os.path.dirname(os.path.abspath(caminho))
+    descritor, temporario = tempfile.mkstemp(dir=diretorio, prefix=f".{os.path.basename(caminho)}.", suffix='.tmp')
+    try:
+        if os.path.exists(caminho):
+            os.chmod(temporario, os.stat(caminho).st_mode & 0o777)
+        with os.fdopen(descritor, 'wb') as arquivo:
+            arquivo.write(conteudo)
+            if sincronizar:
+                arquivo.flush()
+                os.fsync(arquivo.fileno())
+        os.replace(temporario, caminho)
+    except BaseException:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+        raise
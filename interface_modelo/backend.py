@@ -0,0 +1,170 @@
+import asyncio
+import hmac
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Dict, List
+
+from fastapi import Depends, FastAPI, File, Header, HTTPException, Request, UploadFile
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel
+
+import metricas
+import servico_chat
+from controle_fluxo import LimiteExcedido
+from normalizanome import normalizar_nome_arquivo
+
+# Backend HTTP (asyncio) da camada de serviço do chat. Não guarda estado de sessão:
+# o histórico vem em cada requisição, então vários workers/réplicas podem atender
+# as mesmas interfaces. Os clientes dos SDKs são compartilhados dentro de cada worker.
+#
+# Execução: uvicorn backend:app --host 0.0.0.0 --port 8000 --workers 4
+
+# Threads por worker para as chamadas bloqueantes dos SDKs (Gemini, Discovery Engine, GCS)
+THREADS_POR_WORKER = int(os.environ.get("BACKEND_THREADS", "32"))
+
+# Turnos de chat processados ao mesmo tempo por worker; os demais aguardam na fila
+MAX_TURNOS_SIMULTANEOS = int(os.environ.get("BACKEND_MAX_TURNOS", "16"))
+
+# Tamanho máximo aceito por arquivo
+TAMANHO_MAXIMO_UPLOAD = 30 * 1024 * 1024
+
+# Segredo compartilhado com a interface (cliente_backend.py), obrigatório: as rotas (exceto
+# /saude e /metrics) exigem "Authorization: Bearer <token>", e o cabeçalho X-Usuario, enviado
+# por quem já autenticou o usuário, é usado no limite por usuário. Sem o token o backend não
+# inicia, a menos que BACKEND_SEM_AUTENTICACAO=1 (apenas para testes locais): nesse caso as
+# rotas ficam abertas e o limite por usuário é aplicado por endereço IP.
+BACKEND_TOKEN = os.environ.get("BACKEND_TOKEN", "")
+SEM_AUTENTICACAO = os.environ.get("BACKEND_SEM_AUTENTICACAO") == "1"
+
+
+@asynccontextmanager
+async def ciclo_de_vida(app: FastAPI):
+    if not BACKEND_TOKEN:
+        if not SEM_AUTENTICACAO:
+            raise RuntimeError("BACKEND_TOKEN não definido; para testes locais sem autenticação, "
+                               "defina BACKEND_SEM_AUTENTICACAO=1")
+        print("[Backend] Sem autenticação (BACKEND_SEM_AUTENTICACAO=1): use apenas em testes locais")
+    executor = ThreadPoolExecutor(max_workers=THREADS_POR_WORKER, thread_name_prefix="servico")
+    asyncio.get_running_loop().set_default_executor(executor)
+    app.state.limite_turnos = asyncio.Semaphore(MAX_TURNOS_SIMULTANEOS)
+    yield
+    executor.shutdown(wait=False)
+
+
+app = FastAPI(title="Análise de Documentos - Backend", lifespan=ciclo_de_vida)
+
+
+async def autenticar(authorization: str = Header(default="")):
+    # Sem token configurado, só passa com a liberação explícita para testes locais
+    if not BACKEND_TOKEN:
+        if SEM_AUTENTICACAO:
+            return
+        raise HTTPException(status_code=503, detail="Backend sem BACKEND_TOKEN configurado.")
+    if not hmac.compare_digest(authorization.encode(), f"Bearer {BACKEND_TOKEN}".encode()):
+        raise HTTPException(status_code=401, detail="Token do backend inválido ou ausente.")
+
+
+def _chave_limite(request: Request, usuario: str, sessao_id: str):
+    # Chave do limite por usuário: o usuário informado pela interface autenticada ou o IP
+    if BACKEND_TOKEN:
+        return usuario or sessao_id
+    return f"ip:{request.client.host if request.client else 'desconhecido'}"
+
+
+class Mensagem(BaseModel):
+    role: str
+    content: str
+
+
+class PedidoChat(BaseModel):
+    pergunta: str
+    mensagens: List[Mensagem] = []
+    estado_historico: Dict = {}
+
+
+class RespostaChat(BaseModel):
+    resposta: str
+    documentos: List[str]
+    tokens_prompt: int
+    espera_fila: float
+    compartilhada: bool
+    estado_historico: Dict
+
+
+class RespostaUpload(BaseModel):
+    enviados: Dict[str, str]
+    erros: Dict[str, str]
+
+
+@app.get("/saude")
+async def saude():
+    return {"status": "ok"}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return metricas.exportar_prometheus()
+
+
+@app.post("/chat", response_model=RespostaChat, dependencies=[Depends(autenticar)])
+async def chat(
+    pedido: PedidoChat,
+    request: Request,
+    x_sessao_id: str = Header(default=""),
+    x_usuario: str = Header(default=""),
+    x_id_turno: str = Header(default=""),
+):
+    # O estado da conversa pertence à requisição; nada é compartilhado entre sessões
+    estado_historico = dict(pedido.estado_historico)
+    mensagens = [mensagem.model_dump() for mensagem in pedido.mensagens]
+
+    # A espera dos limitadores de taxa é cumprida antes de ocupar uma vaga de processamento
+    try:
+        espera = servico_chat.reservar_turno(_chave_limite(request, x_usuario, x_sessao_id))
+    except LimiteExcedido as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(int(e.espera) + 1)})
+    if espera > 0:
+        await asyncio.sleep(espera)
+
+    async with app.state.limite_turnos:
+        try:
+            resultado = await asyncio.to_thread(
+                servico_chat.responder_pergunta, pedido.pergunta, mensagens, estado_historico,
+                x_sessao_id, x_usuario, x_id_turno or None, espera
+            )
+        except Exception as e:
+            print(f"[Backend] Erro no turno da sessão {x_sessao_id or '-'}: {e}")
+            raise HTTPException(status_code=502, detail=str(e))
+
+    return RespostaChat(estado_historico=estado_historico, **resultado)
+
+
+@app.post("/documentos", response_model=RespostaUpload, dependencies=[Depends(autenticar)])
+async def documentos(arquivos: List[UploadFile] = File(...)):
+    pendentes = []
+    erros = {}
+    for arquivo in arquivos:
+        nome = normalizar_nome_arquivo(arquivo.filename or "")
+        if arquivo.size is not None and arquivo.size > TAMANHO_MAXIMO_UPLOAD:
+            erros[nome] = "O arquivo é maior que 30MB."
+            continue
+        pendentes.append((arquivo.file, nome))
+
+    enviados, erros_envio = await asyncio.to_thread(servico_chat.enviar_documentos, pendentes)
+    erros.update(erros_envio)
+    return RespostaUpload(enviados=enviados, erros=erros)
+
+
+@app.post("/indexacao", dependencies=[Depends(autenticar)])
+async def indexar():
+    try:
+        quantidade = await asyncio.to_thread(servico_chat.indexar_agora)
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=str(e))
+    return {"indexados": quantidade}
+
+
+@app.get("/indexacao", dependencies=[Depends(autenticar)])
+async def indexacao(limite: int = 3):
+    return servico_chat.status_indexacao(limite=limite)
@@ -1,39 +1,201 @@
-from typing import List
-from google.api_core.client_options import ClientOptions
-from google.cloud import discoveryengine_v1 as discoveryengine
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, List, Union
 
-def buscar_documentos_relevantes(
-    pergunta: str,
-    limite_resultados: int = 10,
-    project_id: str = "collavini-genai-prod",
-    location: str = "global",
-    engine_id: str = "app-collavini-pdfs-mais-im_1749670720875"
-) -> List[str]:
+import indice_lexical
+import metricas
+
+# Tempo de vida de uma busca em cache (segundos)
+TTL_CACHE_BUSCA = 600
+
+# Quantidade máxima de buscas mantidas em cache (as menos usadas saem primeiro)
+MAX_ITENS_CACHE_BUSCA = 512
+
+# Limite de páginas percorridas para completar `limite_resultados`
+MAX_PAGINAS_BUSCA = 3
+
+# Tempo máximo (segundos) da busca no Vertex AI Search; acima disso vale só o índice local
+TIMEOUT_BUSCA_REMOTA = 8
+
+# Fusão dos resultados do Vertex AI Search e do índice local (Reciprocal Rank Fusion):
+# cada documento soma peso / (CONSTANTE_FUSAO + posição) em cada lista em que aparece
+CONSTANTE_FUSAO = 60
+PESO_INDICE_LOCAL = 1.0
+
+# Cache LRU + TTL: chave da busca -> (instante de gravação, resultado)
+_cache_busca = OrderedDict()
+_lock_cache_busca = threading.Lock()
+
+# Incrementada a cada reindexação para descartar buscas iniciadas antes dela
+_geracao_cache_busca = 0
+
+
+# Invalida o cache de buscas (chamada quando os documentos são reindexados)
+def limpar_cache_busca():
+    global _geracao_cache_busca
+    with _lock_cache_busca:
+        _cache_busca.clear()
+        _geracao_cache_busca += 1
+
+
+# Um único cliente por endpoint, reaproveitando a conexão entre as buscas
+@lru_cache(maxsize=None)
+def _obter_cliente_busca(location: str):
+    # O SDK do Discovery Engine é importado sob demanda, apenas na primeira busca
+    from google.api_core.client_options import ClientOptions
+    from google.cloud import discoveryengine_v1 as discoveryengine
 
     client_options = (
         ClientOptions(api_endpoint=f"{location}-discoveryengine.googleapis.com")
         if location != "global"
         else None
     )
-    client = discoveryengine.SearchServiceClient(client_options=client_options)
+    return discoveryengine.SearchServiceClient(client_options=client_options)
+
+
+def _ler_cache(chave):
+    with _lock_cache_busca:
+        item = _cache_busca.get(chave)
+        if item is None:
+            return None
+        gravado_em, resultado = item
+        if time.monotonic() - gravado_em > TTL_CACHE_BUSCA:
+            del _cache_busca[chave]
+            return None
+        _cache_busca.move_to_end(chave)
+        return resultado
+
+
+def _gravar_cache(chave, resultado, geracao):
+    with _lock_cache_busca:
+        if geracao != _geracao_cache_busca:
+            return
+        _cache_busca[chave] = (time.monotonic(), resultado)
+        _cache_busca.move_to_end(chave)
+        while len(_cache_busca) > MAX_ITENS_CACHE_BUSCA:
+            _cache_busca.popitem(last=False)
+
+
+def _copiar_resultado(resultado):
+    return [dict(item) if isinstance(item, dict) else item for item in resultado]
+
+
+def _extrair_detalhes(result, link: str) -> Dict:
+    derived_data = result.document.derived_struct_data
+    trechos = [s.get("snippet", "") for s in derived_data.get("snippets", []) if s.get("snippet")]
+    segmentos = [s.get("content", "") for s in derived_data.get("extractive_segments", []) if s.get("content")]
+
+    pontuacao = None
+    if "relevance_score" in result.model_scores:
+        valores = result.model_scores["relevance_score"].values
+        pontuacao = valores[0] if valores else None
+
+    return {
+        "link": link,
+        "titulo": derived_data.get("title", ""),
+        "trechos": trechos,
+        "segmentos": segmentos,
+        "pontuacao": pontuacao,
+    }
+
+
+def _fundir_resultados(remotos, locais, limite_resultados, detalhado):
+    # Os documentos encontrados pelas duas buscas usam os dados (trechos) do Vertex AI Search
+    pontuacoes = {}
+    itens = {}
+    for peso, resultados in ((1.0, remotos), (PESO_INDICE_LOCAL, locais)):
+        for posicao, item in enumerate(resultados, start=1):
+            link = item["link"] if isinstance(item, dict) else item
+            pontuacoes[link] = pontuacoes.get(link, 0.0) + peso / (CONSTANTE_FUSAO + posicao)
+            itens.setdefault(link, item if detalhado else link)
+    ordenados = sorted(pontuacoes, key=pontuacoes.get, reverse=True)[:limite_resultados]
+    return [itens[link] for link in ordenados]
+
+
+def buscar_documentos_relevantes(
+    pergunta: str,
+    limite_resultados: int = 10,
+    project_id: str = "collavini-genai-prod",
+    location: str = "global",
+    engine_id: str = "app-collavini-pdfs-mais-im_1749670720875",
+    detalhado: bool = False,
+    max_segmentos: int = 0
+) -> Union[List[str], List[Dict]]:
+    # Modo padrão: retorna apenas os links (sem pedir trechos à API).
+    # Modo detalhado: retorna dicionários com link, título, trechos, segmentos e pontuação.
+    # Os resultados do Vertex AI Search são combinados com os do índice local (indice_lexical),
+    # que responde sozinho se a busca remota falhar ou passar de TIMEOUT_BUSCA_REMOTA.
+
+    chave = (" ".join(pergunta.lower().split()), limite_resultados, project_id,
+             location, engine_id, detalhado, max_segmentos)
+    em_cache = _ler_cache(chave)
+    if em_cache is not None:
+        return _copiar_resultado(em_cache)
+    geracao = _geracao_cache_busca
+
+    # Primeira passada no índice local: instantânea e sem chamadas de rede
+    with metricas.medir("busca_indice_local"):
+        locais = indice_lexical.buscar(pergunta, limite_resultados)
+
+    try:
+        remotos = _buscar_vertex(pergunta, limite_resultados, project_id, location, engine_id, detalhado, max_segmentos)
+    except Exception as e:
+        if not locais:
+            raise
+        # Sem a busca remota, o resultado não vai para o cache
+        print(f"[Busca] Vertex AI Search indisponível ({type(e).__name__}: {e}); "
+              f"usando {len(locais)} resultado(s) do índice local")
+        metricas.contar("busca_fallback_local_total", motivo=type(e).__name__)
+        return locais if detalhado else [item["link"] for item in locais]
+
+    resultados = _fundir_resultados(remotos, locais, limite_resultados, detalhado)
+    _gravar_cache(chave, resultados, geracao)
+    return _copiar_resultado(resultados)
+
+
+def _buscar_vertex(pergunta, limite_resultados, project_id, location, engine_id, detalhado, max_segmentos):
+    from google.cloud import discoveryengine_v1 as discoveryengine
+
+    client = _obter_cliente_busca(location)
 
     serving_config = f"projects/{project_id}/locations/{location}/collections/default_collection/engines/{engine_id}/servingConfigs/default_config"
 
-    content_search_spec = discoveryengine.SearchRequest.ContentSearchSpec(
-        snippet_spec=discoveryengine.SearchRequest.ContentSearchSpec.SnippetSpec(
-            return_snippet=True
+    content_search_spec = None
+    relevance_score_spec = None
+    if detalhado:
+        content_search_spec = discoveryengine.SearchRequest.ContentSearchSpec(
+            snippet_spec=discoveryengine.SearchRequest.ContentSearchSpec.SnippetSpec(
+                return_snippet=True
+            ),
+            extractive_content_spec=(
+                discoveryengine.SearchRequest.ContentSearchSpec.ExtractiveContentSpec(
+                    max_extractive_segment_count=max_segmentos
+                )
+                if max_segmentos
+                else None
+            )
+        )
+        relevance_score_spec = discoveryengine.SearchRequest.RelevanceScoreSpec(
+            return_relevance_score=True
         )
-    )
 
-    links = []
+    resultados = []
+    links_vistos = set()
     next_page_token = None
+    prazo = time.monotonic() + TIMEOUT_BUSCA_REMOTA
 
-    while True:
+    for pagina in range(MAX_PAGINAS_BUSCA):
+        restante = prazo - time.monotonic()
+        if pagina and restante <= 0:
+            break
         request = discoveryengine.SearchRequest(
             serving_config=serving_config,
             query=pergunta,
             page_size=limite_resultados,
             content_search_spec=content_search_spec,
+            relevance_score_spec=relevance_score_spec,
             query_expansion_spec=discoveryengine.SearchRequest.QueryExpansionSpec(
                 condition=discoveryengine.SearchRequest.QueryExpansionSpec.Condition.AUTO
             ),
@@ -43,16 +205,22 @@ def buscar_documentos_relevantes(
             page_token=next_page_token
         )
 
-        response = client.search(request)
+        response = client.search(request, timeout=max(restante, 0.1))
 
         for result in response.results:
-            document = result.document
-            derived_data = document.derived_struct_data
-            if derived_data and "link" in derived_data:
-                links.append(derived_data["link"])
+            derived_data = result.document.derived_struct_data
+            if not derived_data or "link" not in derived_data:
+                continue
+            link = derived_data["link"]
+            if link in links_vistos:
+                continue
+            links_vistos.add(link)
+            resultados.append(_extrair_detalhes(result, link) if detalhado else link)
+            if len(resultados) >= limite_resultados:
+                break
 
         next_page_token = response.next_page_token
-        if not next_page_token or len(links) >= limite_resultados:
+        if not next_page_token or len(resultados) >= limite_resultados:
             break
 
-    return links[:limite_resultados]
\ No newline at end of file
+    return resultados[:limite_resultados]
@@ -1,25 +1,94 @@
-import streamlit as st
-from google import genai
-from google.genai import types
-from google.auth import default
-from google.auth.exceptions import DefaultCredentialsError
+from functools import lru_cache
+
+# Os SDKs do Google (google.genai, google.auth) são importados sob demanda, para que a
+# tela de login seja exibida sem esperar pelo carregamento deles
 
 GOOGLE_APPLICATION_CREDENTIALS = './chave_collavini.json'
 
-try:
-    credentials, project = default()
-except DefaultCredentialsError:
-    st.error("Erro: Credenciais não encontradas. Verifique se configurou corretamente.")
-    st.stop()
+MODEL = "gemini-2.5-flash"
+
+DATASTORE_VERTEX = "projects/1050374636899/locations/global/collections/default_collection/dataStores/ds-collavini-pdfs-mais-importantes_1749661823675"
+
+# Instrução adicional quando os trechos já foram recuperados pela aplicação
+INSTRUCAO_CONTEXTO = """
+
+    Os trechos relevantes dos documentos são enviados junto com a pergunta, numerados entre colchetes.
+    Responda exclusivamente com base nesses trechos. Se eles não forem suficientes, diga isso claramente."""
+
+
+def formatar_contexto(contexto):
+    # Monta o bloco de trechos (resultados do modo detalhado da busca) enviado ao modelo
+    blocos = []
+    for i, documento in enumerate(contexto, start=1):
+        conteudo = "\n".join(documento.get("segmentos") or documento.get("trechos") or [])
+        if conteudo:
+            blocos.append(f"[{i}] {documento.get('titulo', '')}\n{conteudo}")
+    return "\n\n".join(blocos)
+
 
+# Descoberta das credenciais (ADC) feita uma única vez por processo
+@lru_cache(maxsize=1)
+def obter_credenciais():
+    from google.auth import default
+    from google.auth.exceptions import DefaultCredentialsError
 
+    try:
+        return default(scopes=["https://www.googleapis.com/auth/cloud-platform"])
+    except DefaultCredentialsError as e:
+        raise DefaultCredentialsError(
+            "Erro: Credenciais não encontradas. Verifique se configurou corretamente."
+        ) from e
 
-def generate(text):
-    client = genai.Client(
+
+# Cliente do Gemini compartilhado entre as chamadas
+@lru_cache(maxsize=1)
+def _obter_cliente_genai():
+    from google import genai
+
+    credentials, _ = obter_credenciais()
+    return genai.Client(
         vertexai=True,
         project="collavini-genai-prod",
         location="global",
+        credentials=credentials,
+    )
+
+
+def resumir_historico(resumo_atual, mensagens, orcamento_tokens):
+    from google.genai import types
+
+    # Incorpora as mensagens (pares papel/texto) ao resumo corrente da conversa
+    conversa = "\n".join(
+        f"{'Usuário' if papel == 'user' else 'Assistente'}: {texto}" for papel, texto in mensagens
     )
+    prompt = f"""Atualize o resumo de uma conversa entre um usuário e um assistente jurídico.
+Preserve fatos, nomes, datas, prazos e conclusões relevantes para as próximas perguntas.
+Escreva no máximo {orcamento_tokens * 3 // 4} palavras, sem introdução.
+
+Resumo atual:
+{resumo_atual or "(vazio)"}
+
+Novas mensagens:
+{conversa}"""
+
+    response = _obter_cliente_genai().models.generate_content(
+        model=MODEL,
+        contents=[types.Content(role="user", parts=[types.Part.from_text(text=prompt)])],
+        config=types.GenerateContentConfig(
+            temperature=0.2,
+            max_output_tokens=orcamento_tokens,
+            thinking_config=types.ThinkingConfig(thinking_budget=0),
+        ),
+    )
+    return (response.text or resumo_atual).strip()
+
+
+def gerar_resposta(text, contexto=None, historico=None, resumo=""):
+    # `historico`: pares (papel, texto) já preparados por historico.preparar_historico
+    # Retorna um dicionário com o texto da resposta e a contagem de tokens do turno.
+    from google.genai import types
+
+    client = _obter_cliente_genai()
 
     # Instrução fixa para o modelo
     si_text1 = """Você é um assistente jurídico inteligente. Responda perguntas com base no conteúdo dos documentos disponíveis no Data Store, utilizando linguagem técnica e precisa.
@@ -32,23 +101,30 @@ def generate(text):
 
     A apresentação de documentos será feita exclusivamente pelo sistema fora da sua resposta."""
 
-    model = "gemini-2.5-flash"
-    
+    if resumo:
+        si_text1 += f"\n\n    Resumo da conversa anterior:\n{resumo}"
+
     # Construindo o contexto da conversa a partir do histórico
     contents = []
-    for message in st.session_state.messages:
-        role = "user" if message["role"] == "user" else "model"
-        contents.append(types.Content(role=role, parts=[types.Part.from_text(text=message["content"])]))
+    for role, conteudo in historico or []:
+        contents.append(types.Content(role=role, parts=[types.Part.from_text(text=conteudo)]))
+
+    # Com contexto recuperado pela aplicação, o modelo não faz uma segunda busca no Data Store
+    trechos = formatar_contexto(contexto) if contexto else ""
+    if trechos:
+        si_text1 += INSTRUCAO_CONTEXTO
+        text = f"Trechos dos documentos:\n{trechos}\n\nPergunta: {text}"
+        tools = None
+    else:
+        tools = [
+            types.Tool(retrieval=types.Retrieval(vertex_ai_search=types.VertexAISearch(
+                datastore=DATASTORE_VERTEX
+            )))
+        ]
 
     # Adiciona a pergunta atual
     contents.append(types.Content(role="user", parts=[types.Part.from_text(text=text)]))
 
-    tools = [
-        types.Tool(retrieval=types.Retrieval(vertex_ai_search=types.VertexAISearch(
-            datastore="projects/1050374636899/locations/global/collections/default_collection/dataStores/ds-collavini-pdfs-mais-importantes_1749661823675"
-        )))
-    ]
-    
     generate_content_config = types.GenerateContentConfig(
         temperature=0.5, #anterior era 0.2
         top_p=0.95,
@@ -59,12 +135,21 @@ def generate(text):
     )
 
     response = client.models.generate_content(
-        model=model,
+        model=MODEL,
         contents=contents,
         config=generate_content_config,
     )
 
+    uso = response.usage_metadata
+    resultado = {
+        "texto": "Resposta não encontrada.",
+        "tokens_prompt": (uso.prompt_token_count or 0) if uso else 0,
+        "tokens_resposta": (uso.candidates_token_count or 0) if uso else 0,
+    }
     if response.candidates and response.candidates[0].content and response.candidates[0].content.parts:
-        return response.candidates[0].content.parts[0].text
-    else:
-        return "Resposta não encontrada."
\ No newline at end of file
+        resultado["texto"] = response.candidates[0].content.parts[0].text
+    return resultado
+
+
+def generate(text, contexto=None):
+    return gerar_resposta(text, contexto)["texto"]
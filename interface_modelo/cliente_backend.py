@@ -0,0 +1,117 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from controle_fluxo import LimiteExcedido
+
+# Cliente do backend.py com a mesma interface do servico_chat, usado pelo main.py
+# quando BACKEND_URL está definido
+
+BACKEND_URL = os.environ.get("BACKEND_URL", "").rstrip("/")
+
+# Segredo compartilhado com o backend (ver backend.py); enviado em todas as requisições
+BACKEND_TOKEN = os.environ.get("BACKEND_TOKEN", "")
+
+# Tempo máximo de espera (segundos) por um turno de chat e por um upload
+TIMEOUT_CHAT = 300
+TIMEOUT_UPLOAD = 120
+TIMEOUT_STATUS = 10
+
+# Quantidade máxima de uploads simultâneos
+MAX_UPLOADS_PARALELOS = 4
+
+# Sessão HTTP compartilhada por todas as sessões do Streamlit, reaproveitando as conexões
+_sessao_http = requests.Session()
+_sessao_http.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=64))
+_sessao_http.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=64))
+
+
+def _cabecalhos(**cabecalhos):
+    if BACKEND_TOKEN:
+        cabecalhos["Authorization"] = f"Bearer {BACKEND_TOKEN}"
+    return cabecalhos
+
+
+def _erro_backend(resposta):
+    try:
+        detalhe = resposta.json().get("detail", resposta.text)
+    except ValueError:
+        detalhe = resposta.text
+    return RuntimeError(f"Backend respondeu {resposta.status_code}: {detalhe}")
+
+
+def responder_pergunta(pergunta, mensagens, estado_historico, sessao_id="", usuario="", id_turno=None):
+    resposta = _sessao_http.post(
+        f"{BACKEND_URL}/chat",
+        json={
+            "pergunta": pergunta,
+            "mensagens": [{"role": m["role"], "content": m["content"]} for m in mensagens],
+            "estado_historico": estado_historico,
+        },
+        headers=_cabecalhos(**{"X-Sessao-Id": sessao_id, "X-Usuario": usuario, "X-Id-Turno": id_turno or ""}),
+        timeout=TIMEOUT_CHAT,
+    )
+    if resposta.status_code == 429:
+        raise LimiteExcedido(float(resposta.headers.get("Retry-After", 0)))
+    if not resposta.ok:
+        raise _erro_backend(resposta)
+
+    dados = resposta.json()
+    # Mantém o mesmo contrato do servico_chat: o estado é atualizado in-place
+    estado_historico.clear()
+    estado_historico.update(dados.pop("estado_historico"))
+    return dados
+
+
+def _enviar_documento(arquivo, nome_destino):
+    arquivo.seek(0)
+    resposta = _sessao_http.post(
+        f"{BACKEND_URL}/documentos",
+        files=[("arquivos", (nome_destino, arquivo, "application/pdf"))],
+        headers=_cabecalhos(),
+        timeout=TIMEOUT_UPLOAD,
+    )
+    if not resposta.ok:
+        raise _erro_backend(resposta)
+    return resposta.json()
+
+
+def enviar_documentos(arquivos, ao_concluir=None):
+    enviados = {}
+    erros = {}
+    if not arquivos:
+        return enviados, erros
+
+    with ThreadPoolExecutor(max_workers=min(MAX_UPLOADS_PARALELOS, len(arquivos))) as executor:
+        futuros = {
+            executor.submit(_enviar_documento, arquivo, nome_destino): nome_destino
+            for arquivo, nome_destino in arquivos
+        }
+        for concluidos, futuro in enumerate(as_completed(futuros), start=1):
+            try:
+                dados = futuro.result()
+                enviados.update(dados["enviados"])
+                erros.update(dados["erros"])
+            except Exception as e:
+                erros[futuros[futuro]] = str(e)
+            if ao_concluir:
+                ao_concluir(concluidos, len(futuros))
+
+    return enviados, erros
+
+
+def indexar_agora():
+    resposta = _sessao_http.post(f"{BACKEND_URL}/indexacao", headers=_cabecalhos(), timeout=TIMEOUT_UPLOAD)
+    if not resposta.ok:
+        raise _erro_backend(resposta)
+    return resposta.json()["indexados"]
+
+
+def status_indexacao(limite=3):
+    resposta = _sessao_http.get(f"{BACKEND_URL}/indexacao", params={"limite": limite},
+                                 headers=_cabecalhos(), timeout=TIMEOUT_STATUS)
+    if not resposta.ok:
+        raise _erro_backend(resposta)
+    return resposta.json()
@@ -0,0 +1,85 @@
+import copy
+import hashlib
+import os
+import threading
+from contextlib import contextmanager
+
+import yaml
+from yaml.loader import SafeLoader
+
+from arquivos_compartilhados import gravar_atomico, lock_arquivo
+
+ARQUIVO_CONFIG = './config_credential.yaml'
+
+# Cache do processo: a configuração só é relida quando o mtime/tamanho do arquivo muda,
+# e a versão só avança quando o conteúdo (hash) realmente mudou
+_lock_config = threading.RLock()
+_cache_config = {"assinatura": None, "hash": None, "config": None, "versao": 0}
+
+
+def _assinatura_arquivo():
+    info = os.stat(ARQUIVO_CONFIG)
+    return info.st_mtime_ns, info.st_size
+
+
+def _atualizar_cache():
+    # Deve ser chamada com _lock_config adquirido
+    assinatura = _assinatura_arquivo()
+    if assinatura == _cache_config["assinatura"]:
+        return
+
+    with open(ARQUIVO_CONFIG, 'rb') as file:
+        conteudo = file.read()
+    hash_conteudo = hashlib.sha256(conteudo).hexdigest()
+    if hash_conteudo != _cache_config["hash"]:
+        _cache_config["config"] = yaml.load(conteudo.decode('utf-8'), Loader=SafeLoader)
+        _cache_config["hash"] = hash_conteudo
+        _cache_config["versao"] += 1
+    _cache_config["assinatura"] = assinatura
+
+
+@contextmanager
+def _lock_arquivo():
+    # Serializa as escritas entre threads e processos; o lock do cache é adquirido depois,
+    # para as leituras não esperarem por uma escrita de outro processo
+    with lock_arquivo(f"{ARQUIVO_CONFIG}.lock"), _lock_config:
+        yield
+
+
+# Retorna uma cópia da configuração, que pode ser alterada pela sessão sem afetar as demais
+def carregar_config():
+    with _lock_config:
+        _atualizar_cache()
+        return copy.deepcopy(_cache_config["config"])
+
+
+# Versão atual da configuração; muda sempre que o conteúdo do arquivo é alterado,
+# permitindo que as outras sessões percebam a mudança e recarreguem
+def versao_config():
+    with _lock_config:
+        _atualizar_cache()
+        return _cache_config["versao"]
+
+
+def _gravar(config):
+    # Deve ser chamada com _lock_arquivo adquirido
+    gravar_atomico(ARQUIVO_CONFIG, yaml.dump(config, default_flow_style=False).encode('utf-8'))
+    _atualizar_cache()
+
+
+# Grava a configuração inteira, substituindo o conteúdo do arquivo
+def salvar_config(config):
+    with _lock_arquivo():
+        _gravar(config)
+
+
+# Aplica `alterar(config)` à configuração atual do arquivo, relida sob o lock, e grava o
+# resultado: alterações feitas por outras sessões ou processos desde que a sessão carregou
+# sua cópia não são sobrescritas. Retorna (cópia da configuração gravada, versão)
+def atualizar_config(alterar):
+    with _lock_arquivo():
+        _atualizar_cache()
+        config = copy.deepcopy(_cache_config["config"])
+        alterar(config)
+        _gravar(config)
+        return copy.deepcopy(_cache_config["config"]), _cache_config["versao"]
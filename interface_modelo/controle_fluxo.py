@@ -0,0 +1,251 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+from arquivos_compartilhados import gravar_atomico, lock_arquivo
+
+try:
+    import fcntl
+except ImportError:  # Windows: as chamadas são agrupadas apenas dentro do processo
+    fcntl = None
+
+
+class LimiteExcedido(Exception):
+    # Lançada quando a espera na fila ultrapassaria o máximo permitido
+    def __init__(self, espera):
+        super().__init__(f"Limite de requisições atingido. Tente novamente em {espera:.0f} segundo(s).")
+        self.espera = espera
+
+
+class ChamadaUnica:
+    # Single-flight: chamadas concorrentes com a mesma chave compartilham uma única execução.
+    # A primeira executa a função; as demais aguardam e recebem o mesmo resultado (ou erro).
+    # Com `diretorio`, o agrupamento vale também entre processos (ex.: workers do backend):
+    # quem executa mantém um lock de arquivo pela chave e grava o resultado, que deve ser
+    # serializável em JSON (tuplas voltam como listas); os demais processos aguardam o lock
+    # e leem o resultado. Se quem executava falhou, o erro chega aos demais como RuntimeError
+    # (ou LimiteExcedido, com a mesma espera).
+
+    # Arquivos de chamadas sem uso há mais que isto (segundos) são removidos do diretório
+    VALIDADE_ARQUIVOS = 3600
+
+    def __init__(self, diretorio=None):
+        self.diretorio = diretorio
+        self._lock = threading.Lock()
+        self._em_andamento = {}
+
+    def executar(self, chave, funcao, *args, **kwargs):
+        # Retorna (resultado, compartilhado), onde `compartilhado` indica que outra chamada executou
+        with self._lock:
+            futuro = self._em_andamento.get(chave)
+            lider = futuro is None
+            if lider:
+                futuro = Future()
+                self._em_andamento[chave] = futuro
+
+        if not lider:
+            return futuro.result(), True
+
+        try:
+            if self.diretorio and fcntl is not None:
+                resultado, compartilhado = self._executar_entre_processos(chave, funcao, args, kwargs)
+            else:
+                resultado, compartilhado = funcao(*args, **kwargs), False
+        except BaseException as e:
+            futuro.set_exception(e)
+            raise
+        else:
+            futuro.set_result(resultado)
+            return resultado, compartilhado
+        finally:
+            with self._lock:
+                del self._em_andamento[chave]
+
+    def _executar_entre_processos(self, chave, funcao, args, kwargs):
+        os.makedirs(self.diretorio, exist_ok=True)
+        base = os.path.join(self.diretorio, hashlib.sha256(str(chave).encode('utf-8')).hexdigest())
+        inicio = time.time()
+        with open(f"{base}.lock", 'w') as arquivo_lock:
+            try:
+                fcntl.flock(arquivo_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # Outro processo executa a mesma chamada: aguarda o fim e usa o resultado gravado
+                fcntl.flock(arquivo_lock, fcntl.LOCK_EX)
+                gravado = self._ler_resultado(base, inicio)
+                if gravado is not None:
+                    fcntl.flock(arquivo_lock, fcntl.LOCK_UN)
+                    if "limite" in gravado:
+                        raise LimiteExcedido(gravado["limite"])
+                    if "erro" in gravado:
+                        raise RuntimeError(gravado["erro"])
+                    return gravado["resultado"], True
+                # Sem resultado (ex.: o outro processo terminou sem gravar): executa aqui,
+                # ainda com o lock, para que as próximas chamadas aguardem esta
+
+            try:
+                try:
+                    resultado = funcao(*args, **kwargs)
+                except LimiteExcedido as e:
+                    self._gravar_resultado(base, {"limite": e.espera})
+                    raise
+                except Exception as e:
+                    self._gravar_resultado(base, {"erro": str(e)})
+                    raise
+                self._gravar_resultado(base, {"resultado": resultado})
+                return resultado, False
+            finally:
+                fcntl.flock(arquivo_lock, fcntl.LOCK_UN)
+                self._remover_antigos()
+
+    @staticmethod
+    def _ler_resultado(base, desde):
+        # Resultado gravado a partir de `desde` (anterior a isso é de outra rodada), ou None
+        try:
+            with open(f"{base}.json", 'r', encoding='utf-8') as arquivo:
+                gravado = json.load(arquivo)
+        except (OSError, ValueError):
+            return None
+        return gravado if gravado.get("gravado_em", 0) >= desde else None
+
+    @staticmethod
+    def _gravar_resultado(base, conteudo):
+        conteudo["gravado_em"] = time.time()
+        try:
+            gravar_atomico(f"{base}.json", json.dumps(conteudo, ensure_ascii=False).encode('utf-8'),
+                           sincronizar=False)
+        except (OSError, TypeError, ValueError) as e:
+            print(f"[Fluxo] Resultado da chamada não compartilhado com outros processos: {e}")
+
+    def _remover_antigos(self):
+        limite = time.time() - self.VALIDADE_ARQUIVOS
+        try:
+            with os.scandir(self.diretorio) as entradas:
+                for entrada in entradas:
+                    if entrada.is_file() and entrada.stat().st_mtime < limite:
+                        os.remove(entrada.path)
+        except OSError:
+            pass
+
+
+class BaldeTokens:
+    # Token bucket que admite reservas: os tokens podem ficar negativos, e o
+    # saldo negativo é a fila de quem já reservou e está aguardando
+
+    def __init__(self, taxa_por_segundo, capacidade, agora=None):
+        self.taxa = taxa_por_segundo
+        self.capacidade = capacidade
+        self.tokens = float(capacidade)
+        self.atualizado_em = time.monotonic() if agora is None else agora
+
+    def _reabastecer(self, agora):
+        self.tokens = min(self.capacidade, self.tokens + (agora - self.atualizado_em) * self.taxa)
+        self.atualizado_em = agora
+
+    def espera(self, agora):
+        self._reabastecer(agora)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.taxa
+
+    def reservar(self, agora):
+        self._reabastecer(agora)
+        self.tokens -= 1
+
+    def devolver(self, agora):
+        self._reabastecer(agora)
+        self.tokens = min(self.capacidade, self.tokens + 1)
+
+    def cheio(self, agora):
+        self._reabastecer(agora)
+        return self.tokens >= self.capacidade
+
+
+class LimitadorTaxa:
+    # Um token bucket por chave (ex.: usuário). Quem excede o limite aguarda na fila
+    # até `espera_maxima` segundos; acima disso recebe LimiteExcedido.
+    # Com `arquivo`, os baldes ficam num arquivo JSON compartilhado, sob lock de arquivo,
+    # e o limite vale para todos os processos que usam o mesmo arquivo (ex.: workers do
+    # backend); sem ele, cada processo tem os próprios baldes.
+
+    # Baldes cheios (chaves inativas) são descartados quando houver mais que isto
+    MAX_BALDES = 1000
+
+    def __init__(self, taxa_por_minuto, capacidade, espera_maxima, arquivo=None):
+        self.taxa_por_segundo = taxa_por_minuto / 60
+        self.capacidade = capacidade
+        self.espera_maxima = espera_maxima
+        self.arquivo = arquivo
+        self._lock = threading.Lock()
+        self._baldes = {}
+
+    @contextmanager
+    def _baldes_travados(self):
+        # Retorna (baldes, agora) com acesso exclusivo; com `arquivo`, entre processos, usando
+        # o relógio de parede, comum aos processos, em vez do monotônico
+        if self.arquivo is None:
+            with self._lock:
+                yield self._baldes, time.monotonic()
+            return
+
+        with lock_arquivo(f"{self.arquivo}.lock"), self._lock:
+            try:
+                with open(self.arquivo, 'r', encoding='utf-8') as arquivo:
+                    estado = json.load(arquivo)
+            except FileNotFoundError:
+                estado = {}
+            except ValueError as e:
+                print(f"[Fluxo] Estado dos limites ilegível em {self.arquivo}; reiniciando: {e}")
+                estado = {}
+
+            baldes = {}
+            for chave, (tokens, atualizado_em) in estado.items():
+                balde = baldes[chave] = BaldeTokens(self.taxa_por_segundo, self.capacidade, atualizado_em)
+                balde.tokens = tokens
+            yield baldes, time.time()
+
+            estado = {chave: [b.tokens, b.atualizado_em] for chave, b in baldes.items()}
+            gravar_atomico(self.arquivo, json.dumps(estado).encode('utf-8'), sincronizar=False)
+
+    def _balde(self, baldes, chave, agora):
+        # Deve ser chamada dentro de _baldes_travados
+        balde = baldes.get(chave)
+        if balde is None:
+            if len(baldes) >= self.MAX_BALDES:
+                for chave_inativa in [c for c, b in baldes.items() if b.cheio(agora)]:
+                    del baldes[chave_inativa]
+            balde = baldes[chave] = BaldeTokens(self.taxa_por_segundo, self.capacidade, agora)
+        return balde
+
+    def reservar(self, chave="global"):
+        # Reserva uma vaga sem bloquear; retorna o tempo (segundos) até ela ser liberada,
+        # que o chamador deve aguardar (ex.: com asyncio.sleep, fora de outros limites)
+        with self._baldes_travados() as (baldes, agora):
+            balde = self._balde(baldes, chave, agora)
+            espera = balde.espera(agora)
+            if espera > self.espera_maxima:
+                raise LimiteExcedido(espera)
+            balde.reservar(agora)
+        return espera
+
+    def devolver(self, chave="global"):
+        # Devolve uma vaga reservada que não será usada (ex.: o turno foi recusado por outro limite)
+        with self._baldes_travados() as (baldes, agora):
+            self._balde(baldes, chave, agora).devolver(agora)
+
+    def adquirir(self, chave="global"):
+        # Reserva uma vaga e aguarda até ela ser liberada; retorna o tempo de espera
+        espera = self.reservar(chave)
+        if espera > 0:
+            time.sleep(espera)
+        return espera
+
+    def tentar_adquirir(self, chave="global"):
+        # Reserva uma vaga apenas se houver uma livre agora; para trabalho que pode ser adiado
+        with self._baldes_travados() as (baldes, agora):
+            balde = self._balde(baldes, chave, agora)
+            if balde.espera(agora) > 0:
+                return False
+            balde.reservar(agora)
+            return True
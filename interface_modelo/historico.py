@@ -0,0 +1,111 @@
+import os
+import re
+
+# Quantidade de turnos (pergunta + resposta) mais recentes enviados ao modelo sem alteração
+TURNOS_VERBATIM = 4
+
+# Orçamento de tokens do resumo que substitui as mensagens mais antigas
+ORCAMENTO_TOKENS_RESUMO = 1000
+
+# Orçamento total de tokens do histórico enviado ao modelo (resumo e mensagens). As respostas
+# podem ter dezenas de milhares de tokens: quando os últimos turnos não cabem, os mais antigos
+# saem da janela e passam a ser resumidos, e uma única mensagem maior que o orçamento é cortada
+ORCAMENTO_TOKENS_HISTORICO = int(os.environ.get("ORCAMENTO_TOKENS_HISTORICO", "16000"))
+
+# Prefixo das mensagens de erro gravadas no histórico pelo main.py
+PREFIXO_ERRO = "Ocorreu um erro ao gerar a resposta"
+
+# Blocos acrescentados ao fim da resposta pelo servico_chat.formatar_documentos
+_RE_DOCUMENTOS = re.compile(r'\n\n\*\*Documentos relacionados:\*\*\n.*\Z', re.DOTALL)
+_RE_SEM_DOCUMENTOS = re.compile(r'\n\n_Nenhum documento relacionado encontrado\._\s*\Z')
+
+
+def estimar_tokens(texto: str) -> int:
+    # Aproximação local (~4 caracteres por token), suficiente para controlar o orçamento
+    return len(texto) // 4 + 1
+
+
+def limpar_mensagem(message: dict):
+    # Remove a lista de documentos (com as URLs assinadas) das respostas
+    # e descarta mensagens de erro; retorna None se não sobrar conteúdo útil
+    conteudo = message.get("content") or ""
+    if message.get("role") != "user":
+        if conteudo.startswith(PREFIXO_ERRO):
+            return None
+        conteudo = _RE_DOCUMENTOS.sub("", conteudo)
+        conteudo = _RE_SEM_DOCUMENTOS.sub("", conteudo)
+    conteudo = conteudo.strip()
+    return conteudo or None
+
+
+def truncar_para_orcamento(texto: str, orcamento_tokens: int) -> str:
+    limite = orcamento_tokens * 4
+    if len(texto) <= limite:
+        return texto
+    return texto[-limite:]
+
+
+def _como_texto(mensagens):
+    return "\n".join(f"{papel}: {texto}" for papel, texto in mensagens)
+
+
+def _ultimas_no_orcamento(mensagens, orcamento_tokens):
+    # Maior sequência final de `mensagens` que cabe no orçamento
+    inicio = len(mensagens)
+    while inicio > 0 and estimar_tokens(_como_texto(mensagens[inicio - 1:])) <= orcamento_tokens:
+        inicio -= 1
+    return mensagens[inicio:]
+
+
+def preparar_historico(mensagens, estado, resumir):
+    # Retorna (resumo, recentes): as mensagens antigas são incorporadas a um resumo
+    # incremental guardado em `estado` (ex.: st.session_state) e as dos últimos
+    # TURNOS_VERBATIM turnos seguem sem alteração como pares (papel, texto).
+    # `resumir(resumo_atual, novas_mensagens, orcamento_tokens)` gera o novo resumo, ou
+    # retorna None para adiá-lo (ex.: sem cota do modelo no momento).
+    # As mensagens que saíram da janela só são resumidas quando passam de
+    # ORCAMENTO_TOKENS_RESUMO; até lá seguem sem alteração junto com as recentes,
+    # evitando uma chamada ao modelo a cada turno.
+    # O total fica dentro de ORCAMENTO_TOKENS_HISTORICO: as recentes usam o que sobra do
+    # orçamento do resumo, e a janela encolhe (a partir das mais antigas) até caber.
+    limpas = []
+    for message in mensagens:
+        conteudo = limpar_mensagem(message)
+        if conteudo:
+            limpas.append(("user" if message["role"] == "user" else "model", conteudo))
+
+    orcamento_recentes = max(1, ORCAMENTO_TOKENS_HISTORICO - ORCAMENTO_TOKENS_RESUMO)
+    corte = max(0, len(limpas) - TURNOS_VERBATIM * 2)
+    while corte < len(limpas) - 1 and estimar_tokens(_como_texto(limpas[corte:])) > orcamento_recentes:
+        corte += 1
+    antigas, recentes = limpas[:corte], limpas[corte:]
+    if recentes and estimar_tokens(_como_texto(recentes)) > orcamento_recentes:
+        # Uma única mensagem maior que o orçamento (ex.: uma resposta muito longa)
+        papel, texto = recentes[0]
+        recentes = [(papel, truncar_para_orcamento(texto, orcamento_recentes - estimar_tokens(papel) - 1))]
+
+    resumo = estado.get("resumo_historico", "")
+    ja_resumidas = estado.get("mensagens_resumidas", 0)
+    if ja_resumidas > len(antigas):
+        # O histórico foi reiniciado: descarta o resumo anterior
+        resumo, ja_resumidas = "", 0
+
+    pendentes = antigas[ja_resumidas:]
+    if estimar_tokens(_como_texto(pendentes)) <= ORCAMENTO_TOKENS_RESUMO:
+        return resumo, pendentes + recentes
+
+    try:
+        novo_resumo = resumir(resumo, pendentes, ORCAMENTO_TOKENS_RESUMO)
+        if novo_resumo is None:
+            # Resumo adiado: seguem as pendentes mais recentes que cabem no orçamento do resumo
+            return resumo, _ultimas_no_orcamento(pendentes, ORCAMENTO_TOKENS_RESUMO) + recentes
+        resumo = novo_resumo
+    except Exception as e:
+        # Sem resumo novo, mantém o anterior acrescido das mensagens (cortado ao orçamento)
+        print(f"[Histórico] Erro ao resumir a conversa: {e}")
+        resumo = f"{resumo}\n{_como_texto(pendentes)}".strip()
+    resumo = truncar_para_orcamento(resumo, ORCAMENTO_TOKENS_RESUMO)
+    estado["resumo_historico"] = resumo
+    estado["mensagens_resumidas"] = len(antigas)
+
+    return resumo, recentes
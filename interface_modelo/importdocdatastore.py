@@ -1,22 +1,87 @@
-from google.cloud import discoveryengine
-from google.api_core.client_options import ClientOptions
+import json
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from arquivos_compartilhados import gravar_atomico, lock_arquivo
+from rastreio_operacoes import RastreadorOperacoes
 
 
 # Caminho para a chave JSON da conta de serviço
 GOOGLE_APPLICATION_CREDENTIALS = './chave_collavini.json'
 
+PROJECT_ID = "collavini-genai-prod"
+LOCATION = "global"
+DATA_STORE_ID = "ds-collavini-arquivos_1727374465843"
+GCS_URI = "gs://collavini-arquivos"
 
-def importDocsDataStore():
+# Espera (segundos) após o último pedido antes de submeter a importação, agrupando envios próximos
+ESPERA_AGRUPAMENTO = 30
 
-    project_id = "collavini-genai-prod"
-    location = "global"
-    data_store_id = "ds-collavini-arquivos_1727374465843"
-    gcs_uri = "gs://collavini-arquivos"
+# Espera máxima (segundos) desde o primeiro pedido pendente, para uploads contínuos não adiarem a indexação
+ESPERA_MAXIMA_AGRUPAMENTO = 120
 
-    client_options = ClientOptions(api_endpoint=f"{location}-discoveryengine.googleapis.com")
-    client = discoveryengine.DocumentServiceClient(client_options=client_options)
-    parent = client.branch_path(project=project_id, location=location, data_store=data_store_id, branch="default_branch")
-    source_documents = [f"{gcs_uri}/*"]
+# Quantidade máxima de URIs por requisição de importação
+MAX_URIS_POR_IMPORTACAO = 1000
+
+# Reenvio das URIs cuja importação falhou: a espera dobra a cada tentativa, até o limite,
+# e a URI é descartada (com registro no log) depois de MAX_TENTATIVAS_IMPORTACAO falhas
+ESPERA_MAXIMA_REENVIO = 30 * 60
+MAX_TENTATIVAS_IMPORTACAO = 5
+
+# Fila de indexação compartilhada por todas as sessões e por todos os processos do app
+# (ex.: workers do backend), gravada sob lock de arquivo:
+# {"pendentes": {URI: instante do pedido}, "reenvios": {URI: [tentativas, liberada a partir de]},
+#  "ultimo_pedido": instante}. Cada URI é retirada da fila por um único processo.
+ARQUIVO_FILA_INDEXACAO = './fila_indexacao.json'
+_lock_fila = threading.RLock()
+_temporizador = None
+
+
+@lru_cache(maxsize=1)
+def _obter_cliente_documentos():
+    # O SDK do Discovery Engine é importado sob demanda, apenas na primeira importação
+    from google.cloud import discoveryengine
+    from google.api_core.client_options import ClientOptions
+
+    client_options = ClientOptions(api_endpoint=f"{LOCATION}-discoveryengine.googleapis.com")
+    return discoveryengine.DocumentServiceClient(client_options=client_options)
+
+
+def _caminho_branch(client):
+    return client.branch_path(project=PROJECT_ID, location=LOCATION, data_store=DATA_STORE_ID, branch="default_branch")
+
+
+# Remove do Data Store os documentos importados das URIs (ex.: a versão anterior de um
+# arquivo reenviado). Retorna {uri: mensagem de erro} das que não puderam ser removidas;
+# URIs sem documento no Data Store contam como removidas.
+def remover_documentos(uris):
+    uris = set(uris)
+    if not uris:
+        return {}
+    client = _obter_cliente_documentos()
+    try:
+        documentos = {doc.content.uri: doc.name for doc in client.list_documents(parent=_caminho_branch(client))
+                      if doc.content.uri in uris}
+    except Exception as e:
+        print(f"[Indexação] Erro ao listar os documentos do Data Store: {e}")
+        return {uri: str(e) for uri in uris}
+
+    erros = {}
+    for uri, nome in documentos.items():
+        try:
+            client.delete_document(name=nome)
+        except Exception as e:
+            print(f"[Indexação] Erro ao remover {uri} do Data Store: {e}")
+            erros[uri] = str(e)
+    return erros
+
+
+def _importar(source_documents):
+    from google.cloud import discoveryengine
+
+    client = _obter_cliente_documentos()
+    parent = _caminho_branch(client)
 
     request = discoveryengine.ImportDocumentsRequest(
         parent=parent,
@@ -33,6 +98,194 @@ def importDocsDataStore():
     # Imprime o nome da operação para rastreamento
     path_import_docs = str(operation.operation.name)
     print(f'*************Processo de Importação Foi Iniciado*************')
-    print(path_import_docs)
+    print(f'{path_import_docs} ({len(source_documents)} URI(s))')
+
+    descricao = "bucket inteiro" if source_documents[0].endswith("/*") else f"{len(source_documents)} arquivo(s)"
+    rastreador_importacoes.acompanhar(path_import_docs, descricao)
+    return path_import_docs
+
+
+# Consulta o andamento de uma operação de importação
+def _consultar_operacao(nome):
+    from google.cloud import discoveryengine
+
+    operacao = _obter_cliente_documentos().get_operation(request={"name": nome})
+    estado = {
+        "concluida": operacao.done,
+        "erro": operacao.error.message if operacao.HasField("error") else None,
+        "sucesso": 0,
+        "falha": 0,
+        "total": 0,
+    }
+    if operacao.HasField("metadata"):
+        metadata = discoveryengine.ImportDocumentsMetadata.deserialize(operacao.metadata.value)
+        estado["sucesso"] = metadata.success_count
+        estado["falha"] = metadata.failure_count
+        estado["total"] = metadata.total_count
+    return estado
+
+
+# Rastreador único do processo para as importações iniciadas por qualquer sessão
+rastreador_importacoes = RastreadorOperacoes(_consultar_operacao)
+
+
+# Importa as URIs informadas ou, sem `uris`, o bucket inteiro
+def importDocsDataStore(uris=None):
+    source_documents = list(uris) if uris else [f"{GCS_URI}/*"]
+
+    for inicio in range(0, len(source_documents), MAX_URIS_POR_IMPORTACAO):
+        _importar(source_documents[inicio:inicio + MAX_URIS_POR_IMPORTACAO])
+
+    return "Processado"
+
+
+def _ler_fila():
+    try:
+        with open(ARQUIVO_FILA_INDEXACAO, 'r', encoding='utf-8') as file:
+            fila = json.load(file)
+    except FileNotFoundError:
+        fila = {}
+    except ValueError as e:
+        print(f"Fila de indexação ilegível em {ARQUIVO_FILA_INDEXACAO}; ignorando: {e}")
+        fila = {}
+    fila.setdefault("pendentes", {})
+    fila.setdefault("reenvios", {})
+    fila.setdefault("ultimo_pedido", 0)
+    return fila
+
+
+@contextmanager
+def _fila():
+    # Lê a fila com o lock entre threads e processos e grava as alterações feitas dentro do bloco
+    with lock_arquivo(f"{ARQUIVO_FILA_INDEXACAO}.lock"), _lock_fila:
+        fila = _ler_fila()
+        original = json.dumps(fila, sort_keys=True)
+        yield fila
+        if json.dumps(fila, sort_keys=True) != original:
+            gravar_atomico(ARQUIVO_FILA_INDEXACAO, json.dumps(fila).encode('utf-8'))
+
+
+def _liberada(fila, uri, agora):
+    return fila["reenvios"].get(uri, (0, 0))[1] <= agora
+
+
+def _espera(fila, agora):
+    # Segundos até a próxima submissão (None com a fila vazia): ESPERA_AGRUPAMENTO após o
+    # último pedido, limitada a ESPERA_MAXIMA_AGRUPAMENTO após o primeiro; se todas as URIs
+    # aguardam um reenvio, até a primeira liberação
+    pendentes = fila["pendentes"]
+    if not pendentes:
+        return None
+    liberadas = [instante for uri, instante in pendentes.items() if _liberada(fila, uri, agora)]
+    if liberadas:
+        proxima = min(fila["ultimo_pedido"] + ESPERA_AGRUPAMENTO, min(liberadas) + ESPERA_MAXIMA_AGRUPAMENTO)
+    else:
+        proxima = min(fila["reenvios"][uri][1] for uri in pendentes)
+    return max(0, proxima - agora)
+
+
+def _armar_temporizador(espera):
+    # Agenda (ou cancela, com espera None) a verificação da fila neste processo
+    global _temporizador
+    with _lock_fila:
+        if _temporizador is not None:
+            _temporizador.cancel()
+            _temporizador = None
+        if espera is None:
+            return
+        _temporizador = threading.Timer(espera, _indexar_em_segundo_plano)
+        _temporizador.daemon = True
+        _temporizador.start()
+
+
+# Submete as URIs pendentes na fila, em lotes de MAX_URIS_POR_IMPORTACAO. Com
+# `apenas_liberadas` (submissão automática), nada é submetido antes do fim da espera de
+# agrupamento, e as URIs ainda em espera após uma falha ficam para depois.
+# Apenas os lotes que falharam voltam para a fila; o erro é propagado se nenhum foi aceito.
+def indexar_pendentes(apenas_liberadas=False):
+    agora = time.time()
+    with _fila() as fila:
+        if apenas_liberadas and _espera(fila, agora):
+            uris = []
+        else:
+            uris = [uri for uri in fila["pendentes"] if not apenas_liberadas or _liberada(fila, uri, agora)]
+        for uri in uris:
+            del fila["pendentes"][uri]
+        _armar_temporizador(_espera(fila, agora))
+
+    if not uris:
+        return 0
+
+    falhas, ultimo_erro = [], None
+    for inicio in range(0, len(uris), MAX_URIS_POR_IMPORTACAO):
+        lote = uris[inicio:inicio + MAX_URIS_POR_IMPORTACAO]
+        try:
+            _importar(lote)
+        except Exception as e:
+            print(f"Erro ao submeter a importação de {len(lote)} arquivo(s): {e}")
+            falhas.extend(lote)
+            ultimo_erro = e
+
+    _reagendar_falhas(uris, falhas)
+    if falhas and len(falhas) == len(uris):
+        raise ultimo_erro
+    return len(uris) - len(falhas)
+
+
+def _reagendar_falhas(uris, falhas):
+    # Devolve à fila as URIs dos lotes que falharam, com espera crescente entre as tentativas
+    agora = time.time()
+    with _fila() as fila:
+        reenvios = fila["reenvios"]
+        for uri in uris:
+            if uri not in falhas:
+                reenvios.pop(uri, None)
+                continue
+            tentativas = reenvios.get(uri, (0, 0))[0] + 1
+            if tentativas >= MAX_TENTATIVAS_IMPORTACAO:
+                print(f"Importação de {uri} descartada após {tentativas} tentativas")
+                reenvios.pop(uri, None)
+                continue
+            espera = min(ESPERA_MAXIMA_REENVIO, ESPERA_AGRUPAMENTO * 2 ** tentativas)
+            reenvios[uri] = [tentativas, agora + espera]
+            fila["pendentes"].setdefault(uri, agora)
+        _armar_temporizador(_espera(fila, agora))
+
+
+# Registra URIs para indexação. Pedidos de todas as sessões são agrupados (debounce)
+# e submetidos juntos após ESPERA_AGRUPAMENTO segundos sem novos pedidos.
+# Um novo pedido para uma URI que estava aguardando reenvio reinicia as tentativas.
+def agendar_indexacao(uris):
+    agora = time.time()
+    with _fila() as fila:
+        for uri in uris:
+            fila["pendentes"].setdefault(uri, agora)
+            fila["reenvios"].pop(uri, None)
+            fila["ultimo_pedido"] = agora
+        _armar_temporizador(_espera(fila, agora))
+
+
+# Retira da fila URIs que ainda não foram submetidas (ex.: objetos removidos do bucket)
+def cancelar_indexacao(uris):
+    with _fila() as fila:
+        for uri in uris:
+            fila["pendentes"].pop(uri, None)
+            fila["reenvios"].pop(uri, None)
+        _armar_temporizador(_espera(fila, time.time()))
+
+
+def _indexar_em_segundo_plano():
+    try:
+        indexar_pendentes(apenas_liberadas=True)
+    except Exception:
+        # O erro já foi registrado e as URIs dos lotes com falha voltaram para a fila
+        pass
+
 
-    return "Processado"
\ No newline at end of file
+def quantidade_pendente():
+    fila = _ler_fila()
+    with _lock_fila:
+        if fila["pendentes"] and (_temporizador is None or not _temporizador.is_alive()):
+            # Assume a fila deixada sem temporizador (ex.: por um processo reiniciado)
+            _armar_temporizador(_espera(fila, time.time()))
+    return len(fila["pendentes"])
@@ -0,0 +1,457 @@
+import array
+import heapq
+import json
+import math
+import mmap
+import os
+import re
+import sys
+import threading
+import unicodedata
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from arquivos_compartilhados import gravar_atomico, lock_arquivo
+
+# Índice invertido local (BM25) sobre o texto extraído dos PDFs do bucket. Responde
+# em milissegundos, sem chamadas de rede: é combinado com os resultados do Vertex AI
+# Search e usado sozinho quando a busca remota falha ou demora demais.
+#
+# O índice é formado por segmentos imutáveis, um por lote de documentos adicionados.
+# Cada segmento tem o dicionário de termos (JSON), a tabela de documentos (JSON) e as
+# listas de postings e os textos em arquivos binários lidos via mmap, de modo que
+# abrir o índice não exige ler os postings nem os textos. O manifesto indica os
+# segmentos ativos e em qual segmento está a versão atual de cada documento.
+#
+# Reconstrução a partir do bucket: python indice_lexical.py [--completo]
+
+DIRETORIO_INDICE = './indice_lexical'
+
+# Parâmetros do BM25
+K1 = 1.2
+B = 0.75
+
+# Fusão em camadas: a camada de um segmento depende do seu tamanho (tokens dos documentos
+# vivos), multiplicado por FATOR_FUSAO a cada camada. Quando uma camada acumula FATOR_FUSAO
+# segmentos, apenas eles são fundidos num segmento da camada seguinte; os segmentos grandes
+# e antigos só são regravados quando a camada deles enche, e cada documento é regravado
+# poucas vezes ao longo da vida do índice
+FATOR_FUSAO = 4
+TOKENS_CAMADA_INICIAL = 50_000
+
+# Tamanho (caracteres) do trecho retornado para cada documento encontrado
+TAMANHO_TRECHO = 400
+
+# Texto máximo guardado por documento (caracteres)
+MAX_CARACTERES_DOCUMENTO = 5_000_000
+
+# Documentos baixados do bucket por segmento na reconstrução
+DOCUMENTOS_POR_LOTE = 50
+
+STOPWORDS = frozenset("""
+a ao aos as ate com como da das de dela dele do dos e ela ele em entre essa esse esta este
+foi for ha isso mais mas na nas nao no nos o os ou para pela pelas pelo pelos por qual quais
+que se sem ser seu sua sao tem um uma umas uns
+""".split())
+
+# Remove os acentos sem mudar o tamanho do texto, para que as posições encontradas no
+# texto normalizado valham também para o original
+_TABELA_ACENTOS = {
+    codigo: unicodedata.normalize("NFKD", chr(codigo))[0]
+    for codigo in range(0xC0, 0x250)
+    if len(unicodedata.normalize("NFKD", chr(codigo))) > 1 and unicodedata.normalize("NFKD", chr(codigo))[0].isascii()
+}
+
+_RE_PALAVRA = re.compile(r"\w+")
+
+
+def normalizar(texto):
+    return texto.translate(_TABELA_ACENTOS).lower()
+
+
+def tokenizar(texto):
+    return [t for t in _RE_PALAVRA.findall(normalizar(texto)) if len(t) > 1 and t not in STOPWORDS]
+
+
+def extrair_texto_pdf(conteudo):
+    # O pypdf é importado sob demanda, apenas quando há documentos para indexar
+    from io import BytesIO
+
+    from pypdf import PdfReader
+
+    leitor = PdfReader(BytesIO(conteudo))
+    paginas = []
+    tamanho = 0
+    for pagina in leitor.pages:
+        texto = pagina.extract_text() or ""
+        paginas.append(texto)
+        tamanho += len(texto)
+        if tamanho >= MAX_CARACTERES_DOCUMENTO:
+            break
+    return "\n".join(paginas)[:MAX_CARACTERES_DOCUMENTO]
+
+
+def _mapear(caminho):
+    # Arquivos vazios não podem ser mapeados
+    if os.path.getsize(caminho) == 0:
+        return b""
+    with open(caminho, 'rb') as arquivo:
+        return mmap.mmap(arquivo.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class _Segmento:
+    def __init__(self, diretorio, nome):
+        base = os.path.join(diretorio, nome)
+        with open(f"{base}.termos.json", 'r', encoding='utf-8') as arquivo:
+            self.termos = json.load(arquivo)  # termo -> [início em pares, quantidade de documentos]
+        with open(f"{base}.docs.json", 'r', encoding='utf-8') as arquivo:
+            self.documentos = json.load(arquivo)  # [uri, título, tokens, início do texto, fim do texto]
+        self._postings = _mapear(f"{base}.postings")
+        self._pares = memoryview(self._postings).cast('I') if self._postings else []
+        self._texto = _mapear(f"{base}.texto")
+        self.vivos = set()
+
+    def postings(self, termo):
+        # Pares (documento, frequência) do termo
+        entrada = self.termos.get(termo)
+        if entrada is None:
+            return
+        inicio, quantidade = entrada
+        pares = self._pares[inicio * 2:(inicio + quantidade) * 2]
+        for i in range(0, len(pares), 2):
+            yield pares[i], pares[i + 1]
+
+    def texto(self, documento):
+        _, _, _, inicio, fim = self.documentos[documento]
+        return bytes(self._texto[inicio:fim]).decode('utf-8', errors='ignore')
+
+
+def _escrever_segmento(diretorio, nome, documentos):
+    # `documentos`: [(uri, título, texto)]
+    postings = {}
+    tabela = []
+    textos = bytearray()
+    for numero, (uri, titulo, texto) in enumerate(documentos):
+        tokens = tokenizar(texto)
+        for termo, frequencia in Counter(tokens).items():
+            postings.setdefault(termo, []).extend((numero, frequencia))
+        bruto = texto.encode('utf-8')
+        tabela.append([uri, titulo, len(tokens), len(textos), len(textos) + len(bruto)])
+        textos += bruto
+
+    pares = array.array('I')
+    termos = {}
+    for termo in sorted(postings):
+        termos[termo] = [len(pares) // 2, len(postings[termo]) // 2]
+        pares.extend(postings[termo])
+
+    base = os.path.join(diretorio, nome)
+    gravar_atomico(f"{base}.postings", pares.tobytes())
+    gravar_atomico(f"{base}.texto", bytes(textos))
+    gravar_atomico(f"{base}.docs.json", json.dumps(tabela, ensure_ascii=False).encode('utf-8'))
+    gravar_atomico(f"{base}.termos.json", json.dumps(termos, ensure_ascii=False).encode('utf-8'))
+
+
+class IndiceLexical:
+    # Leituras usam o manifesto em cache, relido quando o arquivo muda (outro processo pode
+    # ter adicionado documentos); escritas são serializadas entre threads e processos
+
+    def __init__(self, diretorio=DIRETORIO_INDICE):
+        self.diretorio = diretorio
+        self._arquivo_manifesto = os.path.join(diretorio, 'manifesto.json')
+        self._lock = threading.RLock()
+        self._assinatura = None
+        self._manifesto = {"sequencia": 0, "segmentos": [], "documentos": {}}
+        self._segmentos = {}
+        self._media_tokens = 0.0
+
+    def _atualizar(self):
+        # Deve ser chamada com self._lock adquirido
+        try:
+            info = os.stat(self._arquivo_manifesto)
+        except FileNotFoundError:
+            return
+        assinatura = (info.st_ino, info.st_mtime_ns, info.st_size)
+        if assinatura == self._assinatura:
+            return
+
+        # Se uma fusão apagar um segmento entre a leitura do manifesto e a abertura dos
+        # arquivos, o manifesto é relido
+        for tentativa in range(3):
+            with open(self._arquivo_manifesto, 'r', encoding='utf-8') as arquivo:
+                manifesto = json.load(arquivo)
+            try:
+                segmentos = {
+                    nome: self._segmentos.get(nome) or _Segmento(self.diretorio, nome)
+                    for nome in manifesto["segmentos"]
+                }
+                break
+            except FileNotFoundError:
+                if tentativa == 2:
+                    raise
+
+        # Um documento reenviado fica vivo apenas no segmento mais recente
+        total_tokens = 0
+        for nome, segmento in segmentos.items():
+            segmento.vivos = {
+                numero for numero, (uri, *_) in enumerate(segmento.documentos)
+                if manifesto["documentos"].get(uri) == nome
+            }
+            total_tokens += sum(segmento.documentos[numero][2] for numero in segmento.vivos)
+
+        self._manifesto = manifesto
+        self._segmentos = segmentos
+        self._media_tokens = total_tokens / max(1, len(manifesto["documentos"]))
+        self._assinatura = assinatura
+
+    @contextmanager
+    def _lock_escrita(self):
+        with lock_arquivo(os.path.join(self.diretorio, '.lock')), self._lock:
+            yield
+
+    def quantidade(self):
+        with self._lock:
+            self._atualizar()
+            return len(self._manifesto["documentos"])
+
+    def contem(self, uri):
+        with self._lock:
+            self._atualizar()
+            return uri in self._manifesto["documentos"]
+
+    def buscar(self, consulta, limite=10):
+        # Retorna [{"link", "titulo", "trechos", "segmentos", "pontuacao"}], como o modo detalhado da busca
+        termos = set(tokenizar(consulta))
+        with self._lock:
+            self._atualizar()
+            segmentos = self._segmentos
+            total_documentos = len(self._manifesto["documentos"])
+            media_tokens = self._media_tokens or 1.0
+
+        if not termos or not total_documentos:
+            return []
+
+        pontuacoes = {}
+        for termo in termos:
+            frequencia_documentos = sum(s.termos[termo][1] for s in segmentos.values() if termo in s.termos)
+            if not frequencia_documentos:
+                continue
+            idf = math.log(1 + (total_documentos - frequencia_documentos + 0.5) / (frequencia_documentos + 0.5))
+            for nome, segmento in segmentos.items():
+                for documento, frequencia in segmento.postings(termo):
+                    if documento not in segmento.vivos:
+                        continue
+                    tokens = segmento.documentos[documento][2]
+                    peso = frequencia * (K1 + 1) / (frequencia + K1 * (1 - B + B * tokens / media_tokens))
+                    chave = (nome, documento)
+                    pontuacoes[chave] = pontuacoes.get(chave, 0.0) + idf * peso
+
+        resultados = []
+        for (nome, documento), pontuacao in heapq.nlargest(limite, pontuacoes.items(), key=lambda item: item[1]):
+            segmento = segmentos[nome]
+            uri, titulo, *_ = segmento.documentos[documento]
+            trecho = self._trecho(segmento.texto(documento), termos)
+            resultados.append({
+                "link": uri,
+                "titulo": titulo,
+                "trechos": [trecho] if trecho else [],
+                "segmentos": [],
+                "pontuacao": pontuacao,
+            })
+        return resultados
+
+    @staticmethod
+    def _trecho(texto, termos):
+        # Janela de TAMANHO_TRECHO caracteres com mais ocorrências dos termos da consulta
+        normalizado = normalizar(texto)
+        if len(normalizado) != len(texto):
+            texto = normalizado
+        padrao = re.compile(r"\b(?:" + "|".join(re.escape(t) for t in sorted(termos)) + r")\b")
+        posicoes = [m.start() for _, m in zip(range(5000), padrao.finditer(normalizado))]
+        if not posicoes:
+            return " ".join(texto[:TAMANHO_TRECHO].split())
+
+        melhor, quantidade, inicio = posicoes[0], 0, 0
+        for fim, posicao in enumerate(posicoes):
+            while posicao - posicoes[inicio] > TAMANHO_TRECHO * 3 // 4:
+                inicio += 1
+            if fim - inicio + 1 > quantidade:
+                melhor, quantidade = posicoes[inicio], fim - inicio + 1
+
+        comeco = max(0, melhor - TAMANHO_TRECHO // 8)
+        comeco = texto.rfind(" ", 0, comeco) + 1 if comeco else 0
+        return " ".join(texto[comeco:comeco + TAMANHO_TRECHO].split())
+
+    def adicionar(self, documentos):
+        # `documentos`: [(uri, texto)]; reenviar uma URI substitui a versão anterior
+        documentos = [(uri, texto) for uri, texto in documentos if texto and texto.strip()]
+        if not documentos:
+            return 0
+
+        with self._lock_escrita():
+            self._atualizar()
+            manifesto = json.loads(json.dumps(self._manifesto))
+            manifesto["sequencia"] += 1
+            nome = f"segmento_{manifesto['sequencia']:06d}"
+            _escrever_segmento(
+                self.diretorio, nome, [(uri, os.path.basename(uri), texto) for uri, texto in documentos]
+            )
+            manifesto["segmentos"].append(nome)
+            for uri, _ in documentos:
+                manifesto["documentos"][uri] = nome
+
+            segmentos_anteriores = set(manifesto["segmentos"])
+            manifesto = self._fundir_segmentos(manifesto, segmentos_anteriores)
+            self._gravar_manifesto(manifesto, segmentos_anteriores)
+        return len(documentos)
+
+    def remover(self, uris):
+        # Retira os documentos do índice; segmentos que ficarem sem documentos vivos são apagados
+        with self._lock_escrita():
+            self._atualizar()
+            manifesto = json.loads(json.dumps(self._manifesto))
+            removidos = [uri for uri in uris if manifesto["documentos"].pop(uri, None)]
+            if not removidos:
+                return 0
+            segmentos_anteriores = set(manifesto["segmentos"])
+            manifesto = self._fundir_segmentos(manifesto, segmentos_anteriores)
+            self._gravar_manifesto(manifesto, segmentos_anteriores)
+        return len(removidos)
+
+    def _abrir_segmento(self, nome):
+        return self._segmentos.get(nome) or _Segmento(self.diretorio, nome)
+
+    @staticmethod
+    def _camada(tamanho):
+        camada, limite = 0, TOKENS_CAMADA_INICIAL
+        while tamanho >= limite:
+            camada, limite = camada + 1, limite * FATOR_FUSAO
+        return camada
+
+    def _fundir_segmentos(self, manifesto, segmentos_anteriores):
+        # Descarta os segmentos sem documentos vivos e funde as camadas que encheram, da menor
+        # para a maior (a fusão de uma camada pode encher a seguinte). Os segmentos criados
+        # aqui são acrescentados a `segmentos_anteriores`, para serem apagados se saírem
+        while True:
+            camadas = {}
+            for nome in list(manifesto["segmentos"]):
+                segmento = self._abrir_segmento(nome)
+                vivos = [tokens for uri, _, tokens, *_ in segmento.documentos if manifesto["documentos"].get(uri) == nome]
+                if not vivos:
+                    manifesto["segmentos"].remove(nome)
+                    continue
+                camadas.setdefault(self._camada(sum(vivos)), []).append(nome)
+
+            cheias = [camada for camada, nomes in camadas.items() if len(nomes) >= FATOR_FUSAO]
+            if not cheias:
+                return manifesto
+            fundidos = camadas[min(cheias)]
+
+            documentos = []
+            for nome in fundidos:
+                segmento = self._abrir_segmento(nome)
+                for numero, (uri, titulo, *_) in enumerate(segmento.documentos):
+                    if manifesto["documentos"].get(uri) == nome:
+                        documentos.append((uri, titulo, segmento.texto(numero)))
+
+            manifesto["sequencia"] += 1
+            nome = f"segmento_{manifesto['sequencia']:06d}"
+            _escrever_segmento(self.diretorio, nome, documentos)
+            segmentos_anteriores.add(nome)
+            manifesto["segmentos"] = [n for n in manifesto["segmentos"] if n not in fundidos] + [nome]
+            for uri, _, _ in documentos:
+                manifesto["documentos"][uri] = nome
+
+    def _gravar_manifesto(self, manifesto, segmentos_anteriores):
+        gravar_atomico(self._arquivo_manifesto, json.dumps(manifesto, ensure_ascii=False).encode('utf-8'))
+        self._atualizar()
+
+        # Os segmentos que saíram numa fusão podem ser apagados: quem já os mapeou continua
+        # lendo normalmente, e quem ainda não os abriu vai reler o manifesto
+        for nome in segmentos_anteriores - set(manifesto["segmentos"]):
+            for sufixo in (".termos.json", ".docs.json", ".postings", ".texto"):
+                try:
+                    os.remove(os.path.join(self.diretorio, nome + sufixo))
+                except FileNotFoundError:
+                    pass
+
+
+# Índice único do processo, compartilhado entre as sessões
+indice = IndiceLexical()
+
+# Extração e indexação dos uploads em segundo plano, uma de cada vez
+_executor_indexacao = ThreadPoolExecutor(max_workers=1, thread_name_prefix="indice-lexical")
+
+
+def buscar(consulta, limite=10):
+    try:
+        return indice.buscar(consulta, limite)
+    except Exception as e:
+        print(f"[Índice local] Erro na busca: {e}")
+        return []
+
+
+def _indexar_pdfs(documentos):
+    textos = []
+    for uri, conteudo in documentos:
+        try:
+            textos.append((uri, extrair_texto_pdf(conteudo)))
+        except Exception as e:
+            print(f"[Índice local] Não foi possível extrair o texto de {uri}: {e}")
+    try:
+        quantidade = indice.adicionar(textos)
+    except Exception as e:
+        print(f"[Índice local] Erro ao indexar {len(textos)} documento(s): {e}")
+        return 0
+    if quantidade:
+        print(f"[Índice local] {quantidade} documento(s) indexado(s)")
+    return quantidade
+
+
+# Extrai o texto e indexa os PDFs em segundo plano; `documentos` é uma lista de (uri gs://, bytes do PDF)
+def indexar_pdfs_em_segundo_plano(documentos):
+    documentos = list(documentos)
+    if documentos:
+        return _executor_indexacao.submit(_indexar_pdfs, documentos)
+    return None
+
+
+def _remover(uris):
+    try:
+        quantidade = indice.remover(uris)
+    except Exception as e:
+        print(f"[Índice local] Erro ao remover {len(uris)} documento(s): {e}")
+        return 0
+    if quantidade:
+        print(f"[Índice local] {quantidade} documento(s) removido(s)")
+    return quantidade
+
+
+# Remove documentos em segundo plano, na mesma fila (e na mesma ordem) das indexações
+def remover_em_segundo_plano(uris):
+    uris = list(uris)
+    if uris:
+        return _executor_indexacao.submit(_remover, uris)
+    return None
+
+
+# Indexa os PDFs do bucket que ainda não estão no índice (ou todos, com `completo`)
+def reconstruir_do_bucket(completo=False):
+    from processastorage import baixar_arquivos
+
+    lote = []
+    total = 0
+    for uri, conteudo in baixar_arquivos(sufixo=".pdf", ignorar=None if completo else indice.contem):
+        lote.append((uri, conteudo))
+        if len(lote) >= DOCUMENTOS_POR_LOTE:
+            total += _indexar_pdfs(lote)
+            lote = []
+    if lote:
+        total += _indexar_pdfs(lote)
+    return total
+
+
+if __name__ == "__main__":
+    indexados = reconstruir_do_bucket(completo="--completo" in sys.argv[1:])
+    print(f"{indexados} documento(s) indexado(s); {indice.quantidade()} no índice")
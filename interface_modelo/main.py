@@ -1,47 +1,129 @@
 import streamlit as st
 import os
-import re
+import uuid
 
-from normalizanome import normalizar_arquivos_na_pasta
-from importdocdatastore import importDocsDataStore
-from processastorage import uploadFile
-from chatvertex import generate
-from buscar_documentos import buscar_documentos_relevantes
-from processastorage import gerar_url_assinada
+import metricas
+from normalizanome import normalizar_nome_arquivo
+from controle_fluxo import LimiteExcedido
 
-def normalizar_nome_arquivo(nome_arquivo: str) -> str:
-    nome_arquivo = nome_arquivo.replace(" ", "_")
-    nome_arquivo = re.sub(r'[^a-zA-Z0-9_]', '', nome_arquivo)
-    return nome_arquivo
+# Com BACKEND_URL definido, a interface é apenas um cliente do backend.py;
+# caso contrário, a camada de serviço roda no próprio processo do Streamlit
+if os.environ.get("BACKEND_URL"):
+    import cliente_backend as servico
+else:
+    import servico_chat as servico
+
+# Tamanho máximo aceito por arquivo
+TAMANHO_MAXIMO_UPLOAD = 30 * 1024 * 1024
+
+def _chave_upload(uploaded_file):
+    # Identifica um arquivo do file_uploader entre os reruns da sessão
+    return getattr(uploaded_file, "file_id", None) or f"{uploaded_file.name}:{uploaded_file.size}"
 
 def upload_pdf():
     st.sidebar.header("📄 Upload de Documento")  # Título visual aprimorado no sidebar
 
-    uploaded_file = st.sidebar.file_uploader("Faça o upload de um arquivo PDF (Máximo 30MB)", type=["pdf"])
-    if uploaded_file is not None:
-        if uploaded_file.size > 30 * 1024 * 1024:
-            st.error("O arquivo é maior que 30MB. Por favor, envie um arquivo menor.")
+    uploaded_files = st.sidebar.file_uploader(
+        "Faça o upload de arquivos PDF (Máximo 30MB cada)", type=["pdf"], accept_multiple_files=True
+    )
+    if not uploaded_files:
+        return None
+
+    # Arquivos já enviados (ou recusados) nesta sessão não são reenviados a cada rerun
+    # do Streamlit; o erro de um arquivo recusado é exibido uma única vez
+    enviados = st.session_state.setdefault("arquivos_enviados", {})
+    recusados = st.session_state.setdefault("arquivos_recusados", {})
+
+    # O nome normalizado é o nome do objeto no bucket: dois arquivos com o mesmo nome
+    # normalizado se sobrescreveriam, então apenas o primeiro da lista é enviado
+    donos_nomes = {}
+    pendentes = {}
+    for uploaded_file in uploaded_files:
+        chave = _chave_upload(uploaded_file)
+        nome = normalizar_nome_arquivo(uploaded_file.name)
+        dono = donos_nomes.setdefault(nome, uploaded_file)
+        if chave in enviados or chave in recusados:
+            continue
+        if dono is not uploaded_file:
+            recusados[chave] = (f"O arquivo {uploaded_file.name} tem o mesmo nome no bucket ({nome}) "
+                                f"que {dono.name}. Renomeie um deles e envie novamente.")
+            st.error(recusados[chave])
+            continue
+        if uploaded_file.size > TAMANHO_MAXIMO_UPLOAD:
+            recusados[chave] = f"O arquivo {uploaded_file.name} é maior que 30MB. Por favor, envie um arquivo menor."
+            st.error(recusados[chave])
+            continue
+        # O nome normalizado é calculado em memória; o conteúdo vai direto para o bucket
+        pendentes[nome] = (chave, uploaded_file)
+
+    if pendentes:
+        progresso = st.sidebar.progress(0.0, text="Enviando arquivos...")
+
+        def atualizar_progresso(concluidos, total):
+            progresso.progress(concluidos / total, text=f"Enviando arquivos... ({concluidos}/{total})")
+
+        uris, erros = servico.enviar_documentos(
+            [(uploaded_file, nome) for nome, (_, uploaded_file) in pendentes.items()],
+            ao_concluir=atualizar_progresso,
+        )
+        progresso.empty()
+
+        for nome, uri in uris.items():
+            enviados[pendentes[nome][0]] = uri
+        for nome, erro in erros.items():
+            recusados[pendentes[nome][0]] = (f"Erro ao enviar o arquivo {nome}: {erro}. "
+                                            "Remova-o e adicione-o novamente para tentar de novo.")
+            st.error(recusados[pendentes[nome][0]])
+
+    uris_sessao = [enviados[_chave_upload(f)] for f in uploaded_files if _chave_upload(f) in enviados]
+    if uris_sessao:
+        st.success("Arquivo enviado para o Bucket!" if len(uris_sessao) == 1 else f"{len(uris_sessao)} arquivos enviados para o Bucket!")
+
+        try:
+            pendentes_indexacao = servico.status_indexacao()["pendentes"]
+        except Exception as e:
+            print(f"Erro ao consultar o status da indexação: {e}")
+            pendentes_indexacao = 0
+
+        if pendentes_indexacao:
+            st.info("Os arquivos serão indexados automaticamente em instantes.")
+            if st.button("Indexar Arquivos"):
+                try:
+                    servico.indexar_agora()
+                    st.success("Indexação iniciada. Os novos documentos ficam disponíveis para busca em alguns minutos.")
+                except Exception as e:
+                    st.error(f"Ocorreu um erro ao iniciar a indexação: {e}")
         else:
-            os.makedirs("downloads", exist_ok=True)
-
-            nome_seguro = normalizar_nome_arquivo(uploaded_file.name)
-            save_path = os.path.join("downloads", nome_seguro)
-            with open(save_path, "wb") as f:
-                f.write(uploaded_file.getbuffer())
-
-            normalizar_arquivos_na_pasta('downloads')
-            uploadFile()
-
-            st.success("Arquivo enviado para o Bucket!")
-            st.warning("Clique no botão abaixo para indexar os arquivos novamente.")
+            st.info("Indexação dos arquivos enviados iniciada. Você pode continuar usando o sistema.")
 
-            if st.button("Indexar Arquivos"):
-                importDocsDataStore()
-                st.success("Indexação iniciada. Este processo pode demorar até 1 hora.")
-                st.info("Você pode continuar usando o sistema enquanto a indexação ocorre.")
+    return uris_sessao or None
 
-            return save_path
-    return None
+# Status das importações, atualizado periodicamente sem recarregar a página
+@st.fragment(run_every=15)
+def exibir_status_indexacao():
+    try:
+        status = servico.status_indexacao()
+    except Exception as e:
+        print(f"Erro ao consultar o status da indexação: {e}")
+        return
+    operacoes, pendentes = status["operacoes"], status["pendentes"]
+    if not operacoes and not pendentes:
+        return
+
+    st.subheader("Indexação")
+    if pendentes:
+        st.caption(f"{pendentes} arquivo(s) aguardando na fila de indexação.")
+
+    for op in operacoes:
+        if op["status"] == "em_andamento":
+            processados = op["sucesso"] + op["falha"]
+            progresso = processados / op["total"] if op["total"] else 0.0
+            st.progress(progresso, text=f"Indexando {op['descricao']}... ({processados}/{op['total'] or '?'})")
+        elif op["status"] == "concluida":
+            falhas = f", {op['falha']} com falha" if op["falha"] else ""
+            st.success(f"Indexação concluída: {op['sucesso']} documento(s) indexado(s){falhas}.")
+        else:
+            st.error(f"Falha na indexação: {op['erro']}")
 
 def main(authenticator):
     try:
@@ -58,7 +140,8 @@ def main(authenticator):
 
         with st.sidebar:
             st.header("Upload de Documento")
-            caminho_arquivo = upload_pdf()
+            arquivos_enviados = upload_pdf()
+            exibir_status_indexacao()
 
         # Exibe o histórico de mensagens anteriores
         for msg in st.session_state.messages:
@@ -72,39 +155,39 @@ def main(authenticator):
             with st.chat_message("user"):
                 st.markdown(prompt)
 
-            # Resposta da IA
-            with st.chat_message("assistant"):
+            # Resposta da IA (as etapas do turno são registradas com o mesmo id de correlação)
+            with st.chat_message("assistant"), metricas.turno() as id_turno:
                 message_placeholder = st.empty()
                 full_response = ""
+                tokens_prompt = 0
                 try:
-                    prompt = prompt.strip().strip('"').strip("'")
-                    resposta_ia = generate(prompt)
-                    resposta_ia = re.split(r'\*\*Documentos relacionados\*\*.*', resposta_ia, flags=re.IGNORECASE)[0].strip()
-                    documentos = buscar_documentos_relevantes(prompt)
-
-                    links_formatados = []
-
-                    for doc_path in documentos:
-                        try:
-                            nome_arquivo = os.path.basename(doc_path)
-                            url = gerar_url_assinada(doc_path)
-                            links_formatados.append(f"- [{nome_arquivo}]({url})")
-                        except Exception as e:
-                            continue
-
-                    if links_formatados:
-                        documentos_md = "\n\n**Documentos relacionados:**\n" + "\n".join(links_formatados)
-                    else:
-                        documentos_md = "\n\n_Nenhum documento relacionado encontrado._"
-
-                    full_response = resposta_ia + documentos_md
+                    # Histórico sem a pergunta atual (já adicionada acima); o resumo das
+                    # mensagens antigas fica guardado na sessão
+                    estado_historico = st.session_state.setdefault("estado_historico", {})
+                    sessao_id = st.session_state.setdefault("sessao_id", uuid.uuid4().hex)
+                    with st.spinner("Gerando resposta..."):
+                        resultado = servico.responder_pergunta(
+                            prompt, st.session_state.messages[:-1], estado_historico,
+                            sessao_id, st.session_state.get("username", ""), id_turno
+                        )
+                    full_response = resultado["resposta"]
+                    tokens_prompt = resultado["tokens_prompt"]
+                    if resultado["espera_fila"] >= 1:
+                        st.caption(f"Sua pergunta aguardou {resultado['espera_fila']:.0f} s na fila devido ao volume de perguntas.")
+
+                except LimiteExcedido as e:
+                    full_response = f"Ocorreu um erro ao gerar a resposta: {e}"
+                    st.warning(f"Muitas perguntas em sequência. {e}")
 
                 except Exception as e:
                     full_response = f"Ocorreu um erro ao gerar a resposta: {e}"
                     st.error(full_response)
 
-                message_placeholder.markdown(full_response)
-                st.session_state.messages.append({"role": "assistant", "content": full_response})
+                with metricas.medir("renderizacao"):
+                    message_placeholder.markdown(full_response)
+                st.session_state.messages.append(
+                    {"role": "assistant", "content": full_response, "tokens_prompt": tokens_prompt}
+                )
 
     elif st.session_state['authentication_status'] is False:
         st.error('Usuário ou senha inválidos')
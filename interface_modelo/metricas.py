@@ -0,0 +1,283 @@
+import atexit
+import bisect
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from arquivos_compartilhados import gravar_atomico
+
+# Rastreamento por turno do chat: cada etapa medida com `medir()` alimenta as
+# métricas de latência (histograma e p50/p95/p99), os contadores de erro e um log
+# estruturado (JSON) com o id do turno, permitindo correlacionar as etapas de uma mesma pergunta.
+
+# Amostras mantidas por etapa para o cálculo dos percentis (relatório do simulacao_carga.py)
+AMOSTRAS_POR_ETAPA = 2048
+
+QUANTIS = (0.5, 0.95, 0.99)
+
+# Limites superiores (segundos) dos buckets do histograma exportado ao Prometheus
+BUCKETS_SEGUNDOS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Com vários processos (ex.: workers do backend), cada um grava periodicamente um retrato das
+# suas métricas neste diretório, e o /metrics de qualquer processo exporta a soma de todos.
+# Deve começar vazio a cada início do serviço (ex.: um diretório em /tmp do contêiner).
+# Sem ele, cada processo exporta apenas as próprias métricas.
+DIRETORIO_METRICAS = os.environ.get("METRICAS_DIRETORIO", "")
+
+# Intervalo (segundos) entre as gravações do retrato do processo
+INTERVALO_GRAVACAO_METRICAS = 5
+
+_id_turno = contextvars.ContextVar("id_turno", default="")
+
+_lock_metricas = threading.Lock()
+_duracoes = {}   # etapa -> {"amostras": deque, "baldes": [int], "soma": float, "contagem": int}
+_contadores = {}  # (nome, rótulos ordenados) -> valor
+_versao = 0      # incrementada a cada alteração, para gravar o retrato só quando mudou
+_gravador = None
+_lock_gravador = threading.Lock()
+_arquivo_processo = os.path.join(DIRETORIO_METRICAS, f"{os.getpid()}-{uuid.uuid4().hex[:8]}.json") \
+    if DIRETORIO_METRICAS else None
+
+logger = logging.getLogger("metricas")
+if not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+def id_turno_atual():
+    return _id_turno.get()
+
+
+@contextmanager
+def turno(id_turno=None):
+    # Define o id de correlação das etapas executadas dentro do bloco
+    token = _id_turno.set(id_turno or uuid.uuid4().hex)
+    try:
+        yield _id_turno.get()
+    finally:
+        _id_turno.reset(token)
+
+
+def registrar_log(evento, **campos):
+    logger.info(json.dumps({"evento": evento, "id_turno": _id_turno.get(), "ts": time.time(), **campos},
+                           ensure_ascii=False, default=str))
+
+
+def observar(etapa, duracao):
+    global _versao
+    with _lock_metricas:
+        serie = _duracoes.get(etapa)
+        if serie is None:
+            serie = _duracoes[etapa] = {"amostras": deque(maxlen=AMOSTRAS_POR_ETAPA),
+                                        "baldes": [0] * len(BUCKETS_SEGUNDOS), "soma": 0.0, "contagem": 0}
+        serie["amostras"].append(duracao)
+        indice = bisect.bisect_left(BUCKETS_SEGUNDOS, duracao)
+        if indice < len(BUCKETS_SEGUNDOS):
+            serie["baldes"][indice] += 1
+        serie["soma"] += duracao
+        serie["contagem"] += 1
+        _versao += 1
+    _iniciar_gravador()
+
+
+def contar(nome, valor=1, **rotulos):
+    global _versao
+    chave = (nome, tuple(sorted(rotulos.items())))
+    with _lock_metricas:
+        _contadores[chave] = _contadores.get(chave, 0) + valor
+        _versao += 1
+    _iniciar_gravador()
+
+
+@contextmanager
+def medir(etapa, **atributos):
+    # Span de uma etapa: mede a duração, conta erros e registra o log estruturado
+    inicio = time.perf_counter()
+    status = "ok"
+    try:
+        yield
+    except Exception as e:
+        status = "erro"
+        contar("chat_erros_total", etapa=etapa, tipo=type(e).__name__)
+        atributos["erro"] = str(e)
+        raise
+    except BaseException:
+        # Interrupções do fluxo (ex.: RerunException/StopException do Streamlit, GeneratorExit) não são erros
+        status = "interrompida"
+        raise
+    finally:
+        duracao = time.perf_counter() - inicio
+        observar(etapa, duracao)
+        registrar_log("span", etapa=etapa, status=status, duracao_ms=round(duracao * 1000, 1), **atributos)
+
+
+def _percentil(ordenadas, quantil):
+    if not ordenadas:
+        return 0.0
+    indice = min(len(ordenadas) - 1, max(0, round(quantil * (len(ordenadas) - 1))))
+    return ordenadas[indice]
+
+
+def resumo_latencias():
+    # {etapa: {"p50": s, "p95": s, "p99": s, "contagem": n}} a partir das amostras recentes
+    with _lock_metricas:
+        series = {etapa: (sorted(serie["amostras"]), serie["contagem"]) for etapa, serie in _duracoes.items()}
+    return {
+        etapa: {**{f"p{int(q * 100)}": _percentil(amostras, q) for q in QUANTIS}, "contagem": contagem}
+        for etapa, (amostras, contagem) in series.items()
+    }
+
+
+def resumo_contadores():
+    # [(nome, {rótulo: valor}, total)] em ordem de nome
+    with _lock_metricas:
+        return [(nome, dict(rotulos), valor) for (nome, rotulos), valor in sorted(_contadores.items())]
+
+
+def _rotulos_prometheus(rotulos):
+    if not rotulos:
+        return ""
+    return "{" + ",".join(f'{chave}="{str(valor)}"' for chave, valor in rotulos) + "}"
+
+
+def _retrato():
+    # Métricas do processo num formato serializável: (retrato, versão)
+    with _lock_metricas:
+        duracoes = {etapa: {"baldes": list(s["baldes"]), "soma": s["soma"], "contagem": s["contagem"]}
+                    for etapa, s in _duracoes.items()}
+        contadores = [[nome, [list(r) for r in rotulos], valor] for (nome, rotulos), valor in _contadores.items()]
+        return {"duracoes": duracoes, "contadores": contadores}, _versao
+
+
+def _gravar_retrato():
+    retrato, versao = _retrato()
+    try:
+        os.makedirs(DIRETORIO_METRICAS, exist_ok=True)
+        gravar_atomico(_arquivo_processo, json.dumps(retrato).encode("utf-8"), sincronizar=False)
+    except OSError as e:
+        print(f"[Métricas] Erro ao gravar as métricas do processo: {e}")
+    return versao
+
+
+def _executar_gravador():
+    gravada = None
+    while True:
+        if _versao != gravada:
+            gravada = _gravar_retrato()
+        time.sleep(INTERVALO_GRAVACAO_METRICAS)
+
+
+def _iniciar_gravador():
+    global _gravador
+    if _arquivo_processo is None or _gravador is not None:
+        return
+    with _lock_gravador:
+        if _gravador is None:
+            _gravador = threading.Thread(target=_executar_gravador, name="gravador-metricas", daemon=True)
+            _gravador.start()
+            atexit.register(_gravar_retrato)
+
+
+def _retratos():
+    # Retrato deste processo (atual) e os gravados pelos demais processos no diretório
+    retratos = [_retrato()[0]]
+    if _arquivo_processo is None:
+        return retratos
+    try:
+        nomes = [nome for nome in os.listdir(DIRETORIO_METRICAS) if nome.endswith(".json")]
+    except FileNotFoundError:
+        nomes = []
+    for nome in nomes:
+        caminho = os.path.join(DIRETORIO_METRICAS, nome)
+        if caminho == _arquivo_processo:
+            continue
+        try:
+            with open(caminho, "r", encoding="utf-8") as arquivo:
+                retratos.append(json.load(arquivo))
+        except (OSError, ValueError) as e:
+            print(f"[Métricas] Ignorando as métricas ilegíveis de {nome}: {e}")
+    return retratos
+
+
+def exportar_prometheus():
+    # Métricas no formato texto do Prometheus, somando as de todos os processos
+    # que compartilham DIRETORIO_METRICAS
+    series = {}
+    contadores = {}
+    for retrato in _retratos():
+        for etapa, serie in retrato["duracoes"].items():
+            if len(serie["baldes"]) != len(BUCKETS_SEGUNDOS):
+                continue
+            total = series.setdefault(etapa, {"baldes": [0] * len(BUCKETS_SEGUNDOS), "soma": 0.0, "contagem": 0})
+            total["baldes"] = [a + b for a, b in zip(total["baldes"], serie["baldes"])]
+            total["soma"] += serie["soma"]
+            total["contagem"] += serie["contagem"]
+        for nome, rotulos, valor in retrato["contadores"]:
+            chave = (nome, tuple(tuple(r) for r in rotulos))
+            contadores[chave] = contadores.get(chave, 0) + valor
+
+    linhas = [
+        "# HELP chat_etapa_duracao_segundos Duração das etapas do turno de chat.",
+        "# TYPE chat_etapa_duracao_segundos histogram",
+    ]
+    for etapa, serie in sorted(series.items()):
+        acumulado = 0
+        for limite, quantidade in zip(BUCKETS_SEGUNDOS, serie["baldes"]):
+            acumulado += quantidade
+            linhas.append(f'chat_etapa_duracao_segundos_bucket{{etapa="{etapa}",le="{limite}"}} {acumulado}')
+        linhas.append(f'chat_etapa_duracao_segundos_bucket{{etapa="{etapa}",le="+Inf"}} {serie["contagem"]}')
+        linhas.append(f'chat_etapa_duracao_segundos_sum{{etapa="{etapa}"}} {serie["soma"]:.6f}')
+        linhas.append(f'chat_etapa_duracao_segundos_count{{etapa="{etapa}"}} {serie["contagem"]}')
+
+    for nome in sorted({nome for nome, _ in contadores}):
+        linhas.append(f"# TYPE {nome} counter")
+        for (nome_contador, rotulos), valor in sorted(contadores.items()):
+            if nome_contador == nome:
+                linhas.append(f"{nome}{_rotulos_prometheus(rotulos)} {valor}")
+
+    return "\n".join(linhas) + "\n"
+
+
+class _HandlerMetricas(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        corpo = exportar_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_servidor = None
+_lock_servidor = threading.Lock()
+
+
+def iniciar_servidor_metricas(porta):
+    # Expõe /metrics numa thread própria (usado pelo processo do Streamlit); idempotente
+    global _servidor
+    with _lock_servidor:
+        if _servidor is not None:
+            return _servidor
+        try:
+            _servidor = ThreadingHTTPServer(("0.0.0.0", porta), _HandlerMetricas)
+        except OSError as e:
+            print(f"[Métricas] Não foi possível abrir a porta {porta}: {e}")
+            return None
+        threading.Thread(target=_servidor.serve_forever, name="servidor-metricas", daemon=True).start()
+        return _servidor
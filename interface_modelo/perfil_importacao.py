@@ -0,0 +1,67 @@
+# Relatório do tempo de importação dos módulos do app (python -X importtime).
+#
+# Uso: python perfil_importacao.py [módulo ...] [--top N]
+#
+# Sem argumentos, mede os módulos carregados até a tela de login (streamlit,
+# streamlit_authenticator e configuracao) e, separadamente, o main.py (carregado
+# após o login) e os SDKs que o app carrega sob demanda no primeiro uso.
+import re
+import subprocess
+import sys
+
+MODULOS_INICIALIZACAO = ["streamlit", "streamlit_authenticator", "configuracao"]
+MODULOS_SOB_DEMANDA = ["main", "google.genai", "google.cloud.discoveryengine_v1", "google.cloud.storage", "google.auth"]
+
+_RE_LINHA = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def medir(modulos):
+    # Retorna [(módulo, tempo próprio em µs, tempo acumulado em µs, profundidade)] na ordem do importtime
+    codigo = "; ".join(f"import {modulo}" for modulo in modulos)
+    processo = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", codigo],
+        capture_output=True, text=True
+    )
+    if processo.returncode != 0:
+        ultima_linha = processo.stderr.strip().splitlines()[-1:] or [""]
+        print(f"Aviso: falha ao importar {', '.join(modulos)}: {ultima_linha[0]}")
+
+    medidas = []
+    for linha in processo.stderr.splitlines():
+        correspondencia = _RE_LINHA.match(linha)
+        if correspondencia:
+            proprio, acumulado, recuo, modulo = correspondencia.groups()
+            medidas.append((modulo, int(proprio), int(acumulado), len(recuo) // 2))
+    return medidas
+
+
+def relatorio(titulo, modulos, top):
+    medidas = medir(modulos)
+    total = sum(acumulado for _, _, acumulado, profundidade in medidas if profundidade == 0)
+
+    print(f"\n=== {titulo} ===")
+    print(f"Total: {total / 1000:.1f} ms em {len(medidas)} módulos")
+    print(f"{'acumulado (ms)':>15} {'próprio (ms)':>13}  módulo")
+    for modulo, proprio, acumulado, _ in sorted(medidas, key=lambda m: m[2], reverse=True)[:top]:
+        print(f"{acumulado / 1000:>15.1f} {proprio / 1000:>13.1f}  {modulo}")
+
+
+def main():
+    argumentos = sys.argv[1:]
+    top = 25
+    if "--top" in argumentos:
+        indice = argumentos.index("--top")
+        top = int(argumentos[indice + 1])
+        del argumentos[indice:indice + 2]
+
+    if argumentos:
+        relatorio("Módulos informados", argumentos, top)
+        return
+
+    relatorio("Inicialização (até a tela de login)", MODULOS_INICIALIZACAO, top)
+    for modulo in MODULOS_SOB_DEMANDA:
+        relatorio(f"Sob demanda: {modulo}", [modulo], 10)
+
+
+if __name__ == "__main__":
+    main()
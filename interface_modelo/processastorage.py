@@ -1,42 +1,205 @@
-from google.cloud import storage
-from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
 import os
-from google.oauth2 import service_account
+import threading
+
+import metricas
 
 # Define o caminho para o arquivo JSON da service account
 os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = './chave_collavini.json'
 
-# Função para gerar URL assinada
-def gerar_url_assinada(caminho_arquivo, tempo_expiracao=240):
+SERVICE_ACCOUNT_FILE = './chave_collavini.json'
+
+# Bucket que recebe os documentos enviados pela interface
+BUCKET_ARQUIVOS = 'collavini-arquivos'
+
+# Quantidade máxima de uploads simultâneos
+MAX_UPLOADS_PARALELOS = 4
+
+# Uma URL em cache só é reaproveitada se ainda tiver pelo menos esta validade (minutos)
+MARGEM_MINIMA_URL = 60
+
+# Quantidade máxima de URLs assinadas mantidas em cache
+MAX_URLS_CACHE = 5000
+
+# Cache de URLs assinadas: caminho gs:// -> (url, data de expiração)
+_cache_urls = {}
+_lock_cache_urls = threading.Lock()
+
+
+# Carrega as credenciais da service account uma única vez por processo
+@lru_cache(maxsize=1)
+def _obter_credenciais():
+    # Os SDKs do Google são importados sob demanda, apenas no primeiro uso
+    from google.oauth2 import service_account
+
+    return service_account.Credentials.from_service_account_file(SERVICE_ACCOUNT_FILE)
+
+
+# Cliente do Cloud Storage compartilhado, usado apenas para montar os blobs
+@lru_cache(maxsize=1)
+def _obter_cliente_storage():
+    from google.cloud import storage
+
+    credentials = _obter_credenciais()
+    return storage.Client(credentials=credentials, project=credentials.project_id)
+
+
+def _separar_caminho(caminho_arquivo):
     # Extrai o nome do bucket e do arquivo
     caminho_split = caminho_arquivo.replace("gs://", "").split("/", 1)
     bucket_name = caminho_split[0]
     blob_name = caminho_split[1]  # NÃO codificar!
+    return bucket_name, blob_name
+
+
+def _podar_cache_urls(agora):
+    # Remove primeiro as URLs vencidas e, se ainda faltar espaço, as que expiram antes
+    for caminho in [c for c, (_, expira_em) in _cache_urls.items() if expira_em <= agora]:
+        del _cache_urls[caminho]
+    excesso = len(_cache_urls) - MAX_URLS_CACHE
+    if excesso > 0:
+        for caminho, _ in sorted(_cache_urls.items(), key=lambda item: item[1][1])[:excesso]:
+            del _cache_urls[caminho]
+
+
+# Gera URLs assinadas em lote, reaproveitando as que ainda têm validade suficiente
+def gerar_urls_assinadas(caminhos_arquivos, tempo_expiracao=240):
+    agora = datetime.now(timezone.utc)
+    margem = timedelta(minutes=min(MARGEM_MINIMA_URL, tempo_expiracao / 2))
+
+    urls = {}
+    pendentes = []
+    with _lock_cache_urls:
+        for caminho in dict.fromkeys(caminhos_arquivos):
+            em_cache = _cache_urls.get(caminho)
+            if em_cache and em_cache[1] - agora >= margem:
+                urls[caminho] = em_cache[0]
+            else:
+                pendentes.append(caminho)
+
+    metricas.contar("urls_assinadas_total", len(urls), origem="cache")
+    metricas.contar("urls_assinadas_total", len(pendentes), origem="assinatura")
+    if not pendentes:
+        return urls
 
-    # Inicializa o cliente do Cloud Storage
-    storage_client = storage.Client()
-    bucket = storage_client.bucket(bucket_name)
-    blob = bucket.blob(blob_name)
+    # A assinatura é feita localmente com a chave da service account, sem chamadas de rede
+    credentials = _obter_credenciais()
+    storage_client = _obter_cliente_storage()
+    expira_em = agora + timedelta(minutes=tempo_expiracao)
 
-    # Gera a URL assinada com tempo de expiração
-    url_assinada = blob.generate_signed_url(expiration=timedelta(minutes=tempo_expiracao))
+    novas = {}
+    for caminho in pendentes:
+        try:
+            with metricas.medir("gerar_url_assinada"):
+                bucket_name, blob_name = _separar_caminho(caminho)
+                blob = storage_client.bucket(bucket_name).blob(blob_name)
+                novas[caminho] = blob.generate_signed_url(expiration=expira_em, credentials=credentials)
+        except Exception as e:
+            print(f"Erro ao gerar URL assinada para {caminho}: {e}")
+
+    with _lock_cache_urls:
+        for caminho, url in novas.items():
+            _cache_urls[caminho] = (url, expira_em)
+        _podar_cache_urls(agora)
+
+    urls.update(novas)
+    return urls
+
+
+# Função para gerar URL assinada
+def gerar_url_assinada(caminho_arquivo, tempo_expiracao=240):
+    url_assinada = gerar_urls_assinadas([caminho_arquivo], tempo_expiracao).get(caminho_arquivo)
+    if url_assinada is None:
+        raise ValueError(f"Não foi possível gerar a URL assinada para {caminho_arquivo}")
     return url_assinada
 
 
-def uploadFile():
+# Envia um arquivo já aberto (ex.: UploadedFile do Streamlit) direto para o bucket, sem passar pelo disco.
+# `metadados` (opcional) é gravado como metadados personalizados do objeto
+def enviar_arquivo(arquivo, nome_destino, bucket_name=BUCKET_ARQUIVOS, content_type="application/pdf", metadados=None):
+    blob = _obter_cliente_storage().bucket(bucket_name).blob(nome_destino)
+    if metadados:
+        blob.metadata = metadados
+    blob.upload_from_file(arquivo, rewind=True, content_type=content_type)
+    print(f"Arquivo {nome_destino} enviado para o bucket {bucket_name}.")
+    return f"gs://{bucket_name}/{nome_destino}"
+
+
+# Envia vários arquivos em paralelo; `arquivos` é uma lista de (arquivo, nome_destino).
+# `ao_concluir(concluidos, total, nome_destino)` é chamada na thread de quem chamou a cada envio finalizado;
+# `metadados` é um dicionário opcional {nome_destino: metadados do objeto}.
+# Retorna ({nome_destino: uri gs://}, {nome_destino: erro})
+def enviar_arquivos(arquivos, bucket_name=BUCKET_ARQUIVOS, ao_concluir=None, metadados=None):
+    enviados = {}
+    erros = {}
+    if not arquivos:
+        return enviados, erros
+
+    with ThreadPoolExecutor(max_workers=min(MAX_UPLOADS_PARALELOS, len(arquivos))) as executor:
+        futuros = {
+            executor.submit(
+                enviar_arquivo, arquivo, nome_destino, bucket_name, metadados=(metadados or {}).get(nome_destino)
+            ): nome_destino
+            for arquivo, nome_destino in arquivos
+        }
+        for concluidos, futuro in enumerate(as_completed(futuros), start=1):
+            nome_destino = futuros[futuro]
+            try:
+                enviados[nome_destino] = futuro.result()
+            except Exception as e:
+                print(f"Erro ao enviar o arquivo {nome_destino}: {e}")
+                erros[nome_destino] = e
+            if ao_concluir:
+                ao_concluir(concluidos, len(futuros), nome_destino)
+
+    return enviados, erros
 
-    # Caminho para o arquivo da chave da Service Account
-    service_account_file = './chave_collavini.json'
+
+# Nomes dos objetos do bucket que começam com `prefixo`
+def listar_arquivos(prefixo, bucket_name=BUCKET_ARQUIVOS):
+    return [blob.name for blob in _obter_cliente_storage().list_blobs(bucket_name, prefix=prefixo)]
+
+
+# Remove os objetos informados do bucket; retorna {nome: erro} dos que não puderam ser removidos
+def remover_arquivos(nomes, bucket_name=BUCKET_ARQUIVOS):
+    bucket = _obter_cliente_storage().bucket(bucket_name)
+    erros = {}
+    for nome in nomes:
+        try:
+            bucket.blob(nome).delete()
+            print(f"Arquivo {nome} removido do bucket {bucket_name}.")
+        except Exception as e:
+            print(f"Erro ao remover o arquivo {nome}: {e}")
+            erros[nome] = e
+    return erros
+
+
+# Baixa os arquivos do bucket terminados em `sufixo`, um de cada vez. `ignorar(uri)` permite
+# pular os que não precisam ser baixados. Gera pares (uri gs://, conteúdo em bytes)
+def baixar_arquivos(bucket_name=BUCKET_ARQUIVOS, sufixo="", ignorar=None):
+    client = _obter_cliente_storage()
+    for blob in client.list_blobs(bucket_name):
+        uri = f"gs://{bucket_name}/{blob.name}"
+        if not blob.name.lower().endswith(sufixo) or (ignorar and ignorar(uri)):
+            continue
+        try:
+            yield uri, blob.download_as_bytes()
+        except Exception as e:
+            print(f"Erro ao baixar o arquivo {uri}: {e}")
+
+
+def uploadFile():
 
     # Caminho local da pasta de onde os arquivos serão movidos
     local_directory = './downloads'
 
     # Nome do bucket de destino
-    bucket_name = 'collavini-arquivos'
+    bucket_name = BUCKET_ARQUIVOS
 
-    # Cria o cliente de armazenamento autenticado usando a service account
-    credentials = service_account.Credentials.from_service_account_file(service_account_file)
-    client = storage.Client(credentials=credentials)
+    # Cliente de armazenamento autenticado usando a service account
+    client = _obter_cliente_storage()
 
     # Acessa o bucket de destino
     bucket = client.bucket(bucket_name)
@@ -44,14 +207,14 @@ def uploadFile():
     # Itera sobre os arquivos na pasta local e faz upload para o bucket
     for filename in os.listdir(local_directory):
         local_file_path = os.path.join(local_directory, filename)
-        
+
         if os.path.isfile(local_file_path):
             # Cria o blob no bucket (arquivo remoto)
             blob = bucket.blob(filename)
-            
+
             # Faz o upload do arquivo para o bucket
             blob.upload_from_filename(local_file_path)
-            
+
             # Deleta o arquivo local após o upload
             os.remove(local_file_path)
-            print(f"Arquivo {filename} movido para o bucket e excluído localmente.")
\ No newline at end of file
+            print(f"Arquivo {filename} movido para o bucket e excluído localmente.")
@@ -0,0 +1,213 @@
+import json
+import os
+import threading
+import time
+
+from arquivos_compartilhados import gravar_atomico, lock_arquivo
+
+# Arquivo local onde o estado das operações é persistido entre reinícios do app
+ARQUIVO_OPERACOES = './operacoes_importacao.json'
+
+# Intervalo de consulta (segundos): começa curto e cresce enquanto nada muda
+INTERVALO_INICIAL = 10
+INTERVALO_MAXIMO = 300
+FATOR_BACKOFF = 1.5
+
+# Quantidade de operações mantidas no histórico
+MAX_OPERACOES_GUARDADAS = 50
+
+
+class RastreadorOperacoes:
+    # Acompanha operações longas (ex.: importações do Data Store) com uma única thread
+    # por processo, compartilhada por todas as sessões do Streamlit.
+    # `consultar(nome)` deve retornar um dicionário com as chaves
+    # "concluida", "erro", "sucesso", "falha" e "total".
+    # Vários processos (ex.: workers do backend) podem compartilhar o mesmo arquivo: cada
+    # gravação mescla, sob lock de arquivo, o estado em disco com o do processo, mantendo
+    # de cada operação a versão atualizada mais recentemente. As funções de `ao_concluir`
+    # rodam em todo processo que vê a operação terminar, seja pela própria consulta ou
+    # pelo estado gravado por outro processo.
+
+    def __init__(self, consultar, arquivo=ARQUIVO_OPERACOES):
+        self._consultar = consultar
+        self._arquivo = arquivo
+        self._lock = threading.RLock()
+        self._acordar = threading.Event()
+        self._thread = None
+        self._ao_concluir = []
+        self._a_notificar = []
+        self._operacoes = {}
+        self._assinatura = None
+        with self._lock:
+            self._recarregar()
+            # Operações já concluídas antes de o processo iniciar não geram notificação
+            self._a_notificar.clear()
+
+        # Retoma o acompanhamento de operações iniciadas antes de um reinício
+        if any(op["status"] == "em_andamento" for op in self._operacoes.values()):
+            self._iniciar()
+
+    def _assinatura_arquivo(self):
+        try:
+            info = os.stat(self._arquivo)
+        except FileNotFoundError:
+            return None
+        return info.st_ino, info.st_mtime_ns, info.st_size
+
+    def _carregar(self):
+        try:
+            with open(self._arquivo, 'r', encoding='utf-8') as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+        except ValueError as e:
+            print(f"[Rastreio] Estado das operações ilegível em {self._arquivo}; ignorando: {e}")
+            return {}
+
+    @staticmethod
+    def _mesclar(destino, origem):
+        # Mantém, de cada operação, a versão atualizada mais recentemente. Retorna os nomes
+        # das operações que passaram a constar como concluídas com sucesso
+        concluidas = []
+        for nome, op in origem.items():
+            atual = destino.get(nome)
+            if atual is None or op["atualizada_em"] > atual["atualizada_em"]:
+                if op["status"] == "concluida" and (atual is None or atual["status"] == "em_andamento"):
+                    concluidas.append(nome)
+                destino[nome] = op
+        return concluidas
+
+    def _recarregar(self):
+        # Deve ser chamada com o lock adquirido; incorpora o que outros processos gravaram
+        assinatura = self._assinatura_arquivo()
+        if assinatura is None or assinatura == self._assinatura:
+            return
+        self._a_notificar.extend(self._mesclar(self._operacoes, self._carregar()))
+        self._assinatura = assinatura
+
+    def _salvar(self):
+        # Deve ser chamada com o lock adquirido; mescla com o estado em disco, sob o lock de
+        # arquivo, e grava de forma atômica
+        try:
+            with lock_arquivo(f"{self._arquivo}.lock"):
+                self._a_notificar.extend(self._mesclar(self._operacoes, self._carregar()))
+                antigas = sorted(self._operacoes.values(), key=lambda op: op["iniciada_em"])
+                for op in antigas[:max(0, len(antigas) - MAX_OPERACOES_GUARDADAS)]:
+                    del self._operacoes[op["nome"]]
+
+                conteudo = json.dumps(self._operacoes, ensure_ascii=False, indent=2)
+                gravar_atomico(self._arquivo, conteudo.encode('utf-8'))
+                self._assinatura = self._assinatura_arquivo()
+        except OSError as e:
+            print(f"[Rastreio] Erro ao salvar o estado das operações: {e}")
+
+    def ao_concluir(self, funcao):
+        # Registra `funcao()`, chamada quando uma operação termina com sucesso (ex.: invalidar caches)
+        with self._lock:
+            if funcao not in self._ao_concluir:
+                self._ao_concluir.append(funcao)
+
+    def _notificar(self):
+        # Chama as funções de `ao_concluir` para as operações concluídas desde a última
+        # notificação; deve ser chamada sem o lock, já que as funções podem ser lentas
+        with self._lock:
+            nomes, self._a_notificar = self._a_notificar, []
+            funcoes = list(self._ao_concluir)
+        for nome in nomes:
+            print(f"[Rastreio] Operação concluída: {nome}")
+            for funcao in funcoes:
+                try:
+                    funcao()
+                except Exception as e:
+                    print(f"[Rastreio] Erro ao notificar a conclusão de {nome}: {e}")
+
+    def acompanhar(self, nome, descricao):
+        agora = time.time()
+        with self._lock:
+            self._operacoes[nome] = {
+                "nome": nome,
+                "descricao": descricao,
+                "status": "em_andamento",
+                "iniciada_em": agora,
+                "atualizada_em": agora,
+                "sucesso": 0,
+                "falha": 0,
+                "total": 0,
+                "erro": None,
+            }
+            self._salvar()
+        self._notificar()
+        self._iniciar()
+        self._acordar.set()
+
+    def operacoes(self, limite=5):
+        # Operações mais recentes primeiro, incluindo as iniciadas por outros processos
+        with self._lock:
+            self._recarregar()
+            recentes = sorted(self._operacoes.values(), key=lambda op: op["iniciada_em"], reverse=True)
+            em_andamento = any(op["status"] == "em_andamento" for op in recentes)
+            recentes = [dict(op) for op in recentes[:limite]]
+        self._notificar()
+        if em_andamento:
+            # Este processo também acompanha a operação (ex.: para invalidar os próprios caches)
+            self._iniciar()
+        return recentes
+
+    def _iniciar(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._executar, name="rastreio-operacoes", daemon=True)
+            self._thread.start()
+
+    def _atualizar(self, nome, estado):
+        # Retorna se houve mudança; uma conclusão com sucesso fica pendente de notificação
+        with self._lock:
+            op = self._operacoes.get(nome)
+            if op is None or op["status"] != "em_andamento":
+                return False
+            anterior = (op["status"], op["sucesso"], op["falha"], op["total"])
+
+            op["sucesso"] = estado.get("sucesso", 0)
+            op["falha"] = estado.get("falha", 0)
+            op["total"] = estado.get("total", 0)
+            if estado.get("concluida"):
+                op["erro"] = estado.get("erro")
+                op["status"] = "erro" if op["erro"] else "concluida"
+
+            if anterior == (op["status"], op["sucesso"], op["falha"], op["total"]):
+                return False
+            op["atualizada_em"] = time.time()
+            if op["status"] == "concluida":
+                self._a_notificar.append(nome)
+            self._salvar()
+            return True
+
+    def _executar(self):
+        intervalo = INTERVALO_INICIAL
+        while True:
+            self._acordar.clear()
+            with self._lock:
+                self._recarregar()
+                pendentes = [nome for nome, op in self._operacoes.items() if op["status"] == "em_andamento"]
+            self._notificar()
+
+            if not pendentes:
+                self._acordar.wait()
+                intervalo = INTERVALO_INICIAL
+                continue
+
+            houve_mudanca = False
+            for nome in pendentes:
+                try:
+                    estado = self._consultar(nome)
+                except Exception as e:
+                    print(f"[Rastreio] Erro ao consultar a operação {nome}: {e}")
+                    continue
+
+                houve_mudanca = self._atualizar(nome, estado) or houve_mudanca
+                self._notificar()
+
+            intervalo = INTERVALO_INICIAL if houve_mudanca else min(intervalo * FATOR_BACKOFF, INTERVALO_MAXIMO)
+            if self._acordar.wait(intervalo):
+                intervalo = INTERVALO_INICIAL
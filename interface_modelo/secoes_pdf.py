@@ -0,0 +1,126 @@
+import hashlib
+import os
+from io import BytesIO
+
+# Verificação dos PDFs antes do upload: PDFs muito grandes indexam devagar, podem passar
+# do limite de conteúdo por documento do Data Store e geram resultados pouco precisos.
+# Eles são divididos em seções (intervalos de páginas) enviadas e indexadas como
+# documentos independentes, cada uma com referência ao documento original.
+
+# Documentos com mais páginas ou bytes que isto são divididos em seções
+MAX_PAGINAS_DOCUMENTO = 100
+MAX_BYTES_DOCUMENTO = 10 * 1024 * 1024
+
+# Páginas por seção; reduzido quando necessário para a seção ficar abaixo de MAX_BYTES_DOCUMENTO
+PAGINAS_POR_SECAO = 50
+
+# Páginas (espalhadas pelo documento) usadas para verificar a camada de texto
+PAGINAS_AMOSTRA_TEXTO = 5
+
+# Abaixo desta média de caracteres por página, o PDF é considerado digitalizado (sem texto)
+MIN_CARACTERES_POR_PAGINA = 50
+
+
+def inspecionar_pdf(conteudo):
+    # Retorna {"paginas", "tamanho", "com_texto", "caracteres_por_pagina"}
+    from pypdf import PdfReader
+
+    leitor = PdfReader(BytesIO(conteudo))
+    if leitor.is_encrypted:
+        leitor.decrypt("")
+    paginas = len(leitor.pages)
+
+    amostra = sorted({i * paginas // PAGINAS_AMOSTRA_TEXTO for i in range(PAGINAS_AMOSTRA_TEXTO)}) if paginas else []
+    caracteres = sum(len((leitor.pages[i].extract_text() or "").strip()) for i in amostra)
+    caracteres_por_pagina = caracteres / len(amostra) if amostra else 0.0
+
+    return {
+        "paginas": paginas,
+        "tamanho": len(conteudo),
+        "com_texto": caracteres_por_pagina >= MIN_CARACTERES_POR_PAGINA,
+        "caracteres_por_pagina": caracteres_por_pagina,
+    }
+
+
+def intervalos_secoes(paginas, tamanho):
+    # Intervalos [início, fim) de páginas de cada seção, ou [] se o documento não precisa ser dividido
+    if paginas <= MAX_PAGINAS_DOCUMENTO and tamanho <= MAX_BYTES_DOCUMENTO:
+        return []
+    por_secao = min(PAGINAS_POR_SECAO, max(1, paginas * MAX_BYTES_DOCUMENTO // max(1, tamanho)))
+    if por_secao >= paginas:
+        return []
+    return [(inicio, min(inicio + por_secao, paginas)) for inicio in range(0, paginas, por_secao)]
+
+
+def prefixo_secoes(nome_destino):
+    # Início do nome de todas as seções de um documento, para localizar as de um envio anterior
+    return f"{os.path.splitext(nome_destino)[0]}__secao"
+
+
+def nome_secao(nome_destino, indice, inicio, fim):
+    # Id estável: o mesmo arquivo gera sempre os mesmos nomes, e um reenvio sobrescreve as seções
+    extensao = os.path.splitext(nome_destino)[1]
+    return f"{prefixo_secoes(nome_destino)}{indice:03d}_p{inicio + 1:04d}-{fim:04d}{extensao or '.pdf'}"
+
+
+def dividir_em_secoes(conteudo, nome_destino, intervalos):
+    # Retorna [(BytesIO da seção, nome da seção, metadados)] com a referência ao original
+    # gravada nos metadados do PDF e nos metadados do objeto no bucket
+    from pypdf import PdfReader, PdfWriter
+
+    leitor = PdfReader(BytesIO(conteudo))
+    if leitor.is_encrypted:
+        leitor.decrypt("")
+    hash_original = hashlib.sha256(conteudo).hexdigest()[:16]
+
+    secoes = []
+    for indice, (inicio, fim) in enumerate(intervalos, start=1):
+        metadados = {
+            "documento_original": nome_destino,
+            "hash_original": hash_original,
+            "paginas": f"{inicio + 1}-{fim}",
+            "secao": f"{indice}/{len(intervalos)}",
+        }
+        escritor = PdfWriter()
+        for numero in range(inicio, fim):
+            escritor.add_page(leitor.pages[numero])
+        escritor.add_metadata({
+            "/Title": f"{nome_destino} (páginas {inicio + 1}-{fim})",
+            "/DocumentoOriginal": nome_destino,
+            "/HashOriginal": hash_original,
+            "/Paginas": metadados["paginas"],
+            "/Secao": metadados["secao"],
+        })
+        saida = BytesIO()
+        escritor.write(saida)
+        saida.seek(0)
+        secoes.append((saida, nome_secao(nome_destino, indice, inicio, fim), metadados))
+    return secoes
+
+
+# Verifica o PDF e retorna os envios correspondentes: [(arquivo, nome_destino, metadados)].
+# Um PDF dentro dos limites (ou que não pôde ser lido) é enviado sem alteração.
+def preparar_envio(arquivo, nome_destino):
+    arquivo.seek(0)
+    conteudo = arquivo.read()
+    try:
+        inspecao = inspecionar_pdf(conteudo)
+    except Exception as e:
+        print(f"[Preflight] Não foi possível inspecionar {nome_destino}; enviando sem alteração: {e}")
+        return [(arquivo, nome_destino, None)]
+
+    if not inspecao["com_texto"]:
+        print(f"[Preflight] {nome_destino} parece digitalizado, sem camada de texto "
+              f"({inspecao['caracteres_por_pagina']:.0f} caracteres por página na amostra)")
+
+    intervalos = intervalos_secoes(inspecao["paginas"], inspecao["tamanho"])
+    if not intervalos:
+        return [(arquivo, nome_destino, None)]
+
+    print(f"[Preflight] {nome_destino}: {inspecao['paginas']} páginas, "
+          f"{inspecao['tamanho'] / 1024 / 1024:.1f} MB; dividido em {len(intervalos)} seções")
+    try:
+        return dividir_em_secoes(conteudo, nome_destino, intervalos)
+    except Exception as e:
+        print(f"[Preflight] Erro ao dividir {nome_destino}; enviando sem alteração: {e}")
+        return [(arquivo, nome_destino, None)]
@@ -0,0 +1,299 @@
+import hashlib
+import json
+import os
+import re
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+
+import indice_lexical
+import metricas
+from arquivos_compartilhados import lock_arquivo
+from buscar_documentos import buscar_documentos_relevantes, limpar_cache_busca
+from chatvertex import gerar_resposta, resumir_historico
+from controle_fluxo import ChamadaUnica, LimiteExcedido, LimitadorTaxa
+from historico import preparar_historico
+from importdocdatastore import (
+    agendar_indexacao, cancelar_indexacao, indexar_pendentes, quantidade_pendente, rastreador_importacoes,
+    remover_documentos
+)
+from processastorage import (
+    BUCKET_ARQUIVOS, MAX_UPLOADS_PARALELOS, enviar_arquivos, gerar_urls_assinadas, listar_arquivos, remover_arquivos
+)
+from secoes_pdf import prefixo_secoes, preparar_envio
+
+# Camada de serviço do chat, sem dependência do Streamlit: usada diretamente pelo
+# main.py (modo local) ou exposta pelo backend.py para vários clientes.
+
+# Quando ativo, a aplicação faz uma única busca e envia os trechos encontrados ao Gemini,
+# em vez de o modelo consultar o Data Store e a aplicação buscar os links separadamente
+MODO_RECUPERACAO_UNICA = True
+
+# Segmentos extrativos por documento enviados como contexto (0 usa apenas os snippets)
+MAX_SEGMENTOS_CONTEXTO = 1
+
+# O cache de buscas é invalidado quando uma importação termina
+rastreador_importacoes.ao_concluir(limpar_cache_busca)
+
+# Perguntas por minuto de cada usuário, com rajada de até RAJADA_USUARIO perguntas
+PERGUNTAS_POR_MINUTO_USUARIO = 6
+RAJADA_USUARIO = 3
+
+# Chamadas por minuto ao Gemini (turnos e resumos do histórico), abaixo da cota do projeto
+TURNOS_POR_MINUTO_GLOBAL = 60
+RAJADA_GLOBAL = 10
+
+# Espera máxima na fila (segundos) antes de recusar a pergunta
+ESPERA_MAXIMA_FILA = 30
+
+# Arquivos locais com o estado dos limites e diretório das chamadas em andamento, compartilhados
+# pelos processos do app (ex.: workers do backend): os limites valem para o conjunto, e
+# perguntas idênticas são agrupadas mesmo quando chegam a workers diferentes
+ARQUIVO_LIMITE_USUARIOS = './limite_usuarios.json'
+ARQUIVO_LIMITE_GLOBAL = './limite_global.json'
+DIRETORIO_CHAMADAS = './chamadas_em_andamento'
+
+limitador_usuarios = LimitadorTaxa(PERGUNTAS_POR_MINUTO_USUARIO, RAJADA_USUARIO, ESPERA_MAXIMA_FILA,
+                                   arquivo=ARQUIVO_LIMITE_USUARIOS)
+limitador_global = LimitadorTaxa(TURNOS_POR_MINUTO_GLOBAL, RAJADA_GLOBAL, ESPERA_MAXIMA_FILA,
+                                 arquivo=ARQUIVO_LIMITE_GLOBAL)
+
+# Perguntas idênticas (mesmo texto e mesmo histórico) em andamento compartilham uma única chamada
+_chamada_unica = ChamadaUnica(DIRETORIO_CHAMADAS)
+
+# Locks de arquivo por nome de destino: envios do mesmo arquivo por sessões ou processos
+# diferentes são serializados, para a limpeza de um não remover os objetos recém-enviados do outro
+DIRETORIO_LOCKS_ENVIO = './envios_em_andamento'
+
+
+def formatar_documentos(documentos, urls):
+    links_formatados = []
+    for doc_path in documentos:
+        url = urls.get(doc_path)
+        if url:
+            nome_arquivo = os.path.basename(doc_path)
+            links_formatados.append(f"- [{nome_arquivo}]({url})")
+
+    if links_formatados:
+        return "\n\n**Documentos relacionados:**\n" + "\n".join(links_formatados)
+    return "\n\n_Nenhum documento relacionado encontrado._"
+
+
+def _buscar_e_gerar(pergunta, historico, resumo, limitar):
+    espera = 0.0
+    if limitar:
+        with metricas.medir("fila_global"):
+            espera = limitador_global.adquirir()
+
+    if MODO_RECUPERACAO_UNICA:
+        with metricas.medir("buscar_documentos_relevantes"):
+            resultados = buscar_documentos_relevantes(
+                pergunta, detalhado=True, max_segmentos=MAX_SEGMENTOS_CONTEXTO
+            )
+        documentos = [r["link"] for r in resultados]
+        with metricas.medir("generate"):
+            resposta = gerar_resposta(pergunta, contexto=resultados, historico=historico, resumo=resumo)
+    else:
+        with metricas.medir("generate"):
+            resposta = gerar_resposta(pergunta, historico=historico, resumo=resumo)
+        with metricas.medir("buscar_documentos_relevantes"):
+            documentos = buscar_documentos_relevantes(pergunta)
+
+    metricas.contar("chat_tokens_total", resposta["tokens_prompt"], tipo="prompt")
+    metricas.contar("chat_tokens_total", resposta["tokens_resposta"], tipo="resposta")
+    return documentos, resposta, espera
+
+
+def _resumir_com_cota(resumo_atual, mensagens, orcamento_tokens):
+    # O resumo também é uma chamada ao Gemini e consome a cota global; sem vaga livre
+    # ele é adiado para um próximo turno em vez de segurar o turno atual na fila
+    if not limitador_global.tentar_adquirir():
+        print("[Chat] Resumo do histórico adiado: limite global de chamadas ao modelo atingido")
+        return None
+    return resumir_historico(resumo_atual, mensagens, orcamento_tokens)
+
+
+# Reserva as vagas do turno nos limitadores (do usuário e global) sem bloquear e retorna
+# a espera (segundos) até o turno poder prosseguir. Usada pelo backend.py, que aguarda a
+# espera sem ocupar uma vaga de processamento e depois chama responder_pergunta com
+# `espera_reservada`. Lança LimiteExcedido como responder_pergunta; um turno recusado pelo
+# limite global devolve a vaga do usuário.
+def reservar_turno(chave_usuario):
+    chave_usuario = chave_usuario or "anonimo"
+    espera_usuario = limitador_usuarios.reservar(chave_usuario)
+    try:
+        espera_global = limitador_global.reservar()
+    except LimiteExcedido:
+        limitador_usuarios.devolver(chave_usuario)
+        raise
+    return max(espera_usuario, espera_global)
+
+
+# Processa um turno do chat. `mensagens` é o histórico anterior (sem a pergunta atual) e
+# `estado_historico` guarda o resumo incremental da conversa; é atualizado in-place.
+# Retorna {"resposta": markdown exibido, "documentos": [caminhos gs://], "tokens_prompt": int,
+#          "espera_fila": segundos aguardados nos limitadores, "compartilhada": bool}.
+# Lança controle_fluxo.LimiteExcedido se a espera na fila passar de ESPERA_MAXIMA_FILA.
+# Com `espera_reservada`, as vagas já foram reservadas com reservar_turno e a espera cumprida.
+# As etapas são registradas em `metricas` com o id do turno (`id_turno` ou o do contexto atual).
+def responder_pergunta(pergunta, mensagens, estado_historico, sessao_id="", usuario="", id_turno=None,
+                       espera_reservada=None):
+    with metricas.turno(id_turno or metricas.id_turno_atual() or None):
+        with metricas.medir("turno", sessao=sessao_id, usuario=usuario):
+            return _responder_pergunta(pergunta, mensagens, estado_historico, sessao_id, usuario, espera_reservada)
+
+
+def _responder_pergunta(pergunta, mensagens, estado_historico, sessao_id, usuario, espera_reservada):
+    pergunta = pergunta.strip().strip('"').strip("'")
+    limitar = espera_reservada is None
+    chave_usuario = usuario or sessao_id or "anonimo"
+    if limitar:
+        with metricas.medir("fila_usuario"):
+            espera = limitador_usuarios.adquirir(chave_usuario)
+    else:
+        espera = espera_reservada
+
+    # Histórico com as mensagens antigas resumidas
+    with metricas.medir("historico"):
+        resumo, historico = preparar_historico(mensagens, estado_historico, _resumir_com_cota)
+
+    chave = hashlib.sha256(json.dumps(
+        [" ".join(pergunta.lower().split()), resumo, historico, MODO_RECUPERACAO_UNICA]
+    ).encode("utf-8")).hexdigest()
+    try:
+        (documentos, resposta, espera_global), compartilhada = _chamada_unica.executar(
+            chave, _buscar_e_gerar, pergunta, historico, resumo, limitar
+        )
+    except LimiteExcedido:
+        # Recusado pelo limite global: a vaga do usuário não foi usada
+        if limitar:
+            limitador_usuarios.devolver(chave_usuario)
+        raise
+    metricas.contar("chat_turnos_total", compartilhada=compartilhada)
+    if compartilhada:
+        print(f"[Chat] Sessão {sessao_id or '-'}: resposta compartilhada com uma pergunta idêntica em andamento")
+
+    tokens_prompt = resposta["tokens_prompt"]
+    print(f"[Chat] Sessão {sessao_id or '-'}: tokens do prompt neste turno: {tokens_prompt}")
+    resposta_ia = re.split(r'\*\*Documentos relacionados\*\*.*', resposta["texto"], flags=re.IGNORECASE)[0].strip()
+
+    # Assina todas as URLs de uma vez, reaproveitando as que estão em cache
+    with metricas.medir("assinar_urls", documentos=len(documentos)):
+        urls = gerar_urls_assinadas(documentos)
+
+    return {
+        "resposta": resposta_ia + formatar_documentos(documentos, urls),
+        "documentos": documentos,
+        "tokens_prompt": tokens_prompt,
+        "espera_fila": espera + espera_global,
+        "compartilhada": compartilhada,
+    }
+
+
+# Envia os arquivos ao bucket e coloca os que foram enviados na fila de indexação.
+# PDFs grandes são divididos em seções (secoes_pdf), enviadas em paralelo como documentos independentes.
+# `arquivos` é uma lista de (arquivo, nome_destino); retorna ({nome: uri}, {nome: mensagem de erro}),
+# onde a uri de um PDF dividido é a da primeira seção e basta uma seção com erro para o arquivo falhar.
+# `ao_concluir(concluidos, total)` conta os arquivos recebidos: um PDF dividido conta quando
+# todas as suas seções terminam.
+def enviar_documentos(arquivos, ao_concluir=None):
+    with ExitStack() as locks:
+        # Em ordem, para dois envios com nomes em comum não se bloquearem mutuamente
+        for nome_destino in sorted({nome for _, nome in arquivos}):
+            chave = hashlib.sha256(nome_destino.encode("utf-8")).hexdigest()
+            locks.enter_context(lock_arquivo(os.path.join(DIRETORIO_LOCKS_ENVIO, f"{chave}.lock")))
+        return _enviar_documentos(arquivos, ao_concluir)
+
+
+def _enviar_documentos(arquivos, ao_concluir):
+    envios = []
+    originais = {}
+    metadados = {}
+    for arquivo, nome_destino in arquivos:
+        for arquivo_envio, nome_envio, metadados_envio in preparar_envio(arquivo, nome_destino):
+            envios.append((arquivo_envio, nome_envio))
+            originais[nome_envio] = nome_destino
+            if metadados_envio:
+                metadados[nome_envio] = metadados_envio
+
+    secoes_restantes = Counter(originais.values())
+    arquivos_concluidos = []
+
+    def ao_concluir_envio(concluidos, total, nome_envio):
+        nome = originais[nome_envio]
+        secoes_restantes[nome] -= 1
+        if not secoes_restantes[nome]:
+            arquivos_concluidos.append(nome)
+            if ao_concluir:
+                ao_concluir(len(arquivos_concluidos), len(secoes_restantes))
+
+    uris_envio, erros_envio = enviar_arquivos(envios, ao_concluir=ao_concluir_envio, metadados=metadados)
+
+    # Apenas os arquivos recém-enviados entram na fila de indexação, compartilhada entre as sessões
+    if uris_envio:
+        agendar_indexacao(uris_envio.values())
+
+        # O índice local é atualizado em segundo plano, já disponível antes da importação no Data Store
+        conteudos = []
+        for arquivo, nome_envio in envios:
+            if nome_envio in uris_envio:
+                arquivo.seek(0)
+                conteudos.append((uris_envio[nome_envio], arquivo.read()))
+        futuro = indice_lexical.indexar_pdfs_em_segundo_plano(conteudos)
+        if futuro is not None:
+            futuro.add_done_callback(lambda _: limpar_cache_busca())
+
+    erros = {}
+    for nome_envio, erro in sorted(erros_envio.items()):
+        nome = originais[nome_envio]
+        mensagem = str(erro) if nome_envio == nome else f"{nome_envio}: {erro}"
+        erros[nome] = f"{erros[nome]}; {mensagem}" if nome in erros else mensagem
+
+    uris = {}
+    for nome_envio, uri in sorted(uris_envio.items()):
+        if originais[nome_envio] not in erros:
+            uris.setdefault(originais[nome_envio], uri)
+
+    if uris:
+        with ThreadPoolExecutor(max_workers=min(MAX_UPLOADS_PARALELOS, len(uris))) as executor:
+            for nome in uris:
+                executor.submit(
+                    _remover_versao_anterior, nome, {n for n, original in originais.items() if original == nome}
+                )
+    return uris, erros
+
+
+# Um reenvio dividido em outras seções, ou que deixou de ser dividido, não deixa os objetos
+# da versão anterior no bucket, no Data Store, na fila de indexação e no índice local.
+# Um objeto só é apagado do bucket depois de o documento sair do Data Store, para as buscas
+# não retornarem links para objetos inexistentes; se a remoção no Data Store falhar, o
+# objeto fica no bucket e é removido num próximo reenvio.
+def _remover_versao_anterior(nome_destino, nomes_enviados):
+    try:
+        antigos = [nome for nome in listar_arquivos(prefixo_secoes(nome_destino)) if nome not in nomes_enviados]
+        if nome_destino not in nomes_enviados:
+            antigos += [nome for nome in listar_arquivos(nome_destino) if nome == nome_destino]
+        if not antigos:
+            return
+        uris = {nome: f"gs://{BUCKET_ARQUIVOS}/{nome}" for nome in antigos}
+        cancelar_indexacao(uris.values())
+        erros_data_store = remover_documentos(uris.values())
+        fora_do_data_store = [nome for nome, uri in uris.items() if uri not in erros_data_store]
+        if not fora_do_data_store:
+            return
+        limpar_cache_busca()
+        indice_lexical.remover_em_segundo_plano([uris[nome] for nome in fora_do_data_store])
+        remover_arquivos(fora_do_data_store)
+    except Exception as e:
+        print(f"[Upload] Erro ao remover a versão anterior de {nome_destino}: {e}")
+
+
+def indexar_agora():
+    return indexar_pendentes()
+
+
+def status_indexacao(limite=3):
+    return {
+        "pendentes": quantidade_pendente(),
+        "operacoes": rastreador_importacoes.operacoes(limite=limite),
+    }
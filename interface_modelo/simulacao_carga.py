@@ -0,0 +1,250 @@
+# Teste de carga offline do chat, com os clientes do Gemini, do Vertex AI Search e do
+# Cloud Storage substituídos pelos simuladores (simuladores.py).
+#
+# Uso: python simulacao_carga.py [--sessoes N] [--perguntas N] [--uploads N] [--http] ...
+#
+# Cada sessão simulada percorre o mesmo caminho do main.py: envia PDFs, faz perguntas
+# (com o histórico acumulado da sessão) e recebe a resposta com os links assinados.
+# Com --http, as sessões usam o cliente_backend.py contra o backend.py executado neste
+# processo. Ao final são exibidos a vazão e os percentis de latência de cada operação
+# e de cada etapa do turno. Requer os pacotes do requirements.txt, mas não credenciais.
+import argparse
+import io
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+from functools import lru_cache
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import metricas
+import simuladores
+from controle_fluxo import LimiteExcedido, LimitadorTaxa
+from normalizanome import normalizar_nome_arquivo
+
+PERGUNTAS_BASE = [
+    "Qual o prazo para apresentar a contestação no processo {n}?",
+    "Quais cláusulas do contrato {n} tratam de rescisão?",
+    "Resuma as obrigações das partes no acordo {n}.",
+    "Existe multa prevista por atraso no contrato {n}?",
+    "Quais documentos mencionam a audiência {n}?",
+]
+
+
+def _argumentos():
+    parser = argparse.ArgumentParser(description="Teste de carga offline do chat com clientes simulados.")
+    parser.add_argument("--sessoes", type=int, default=20, help="sessões simultâneas")
+    parser.add_argument("--perguntas", type=int, default=5, help="perguntas por sessão")
+    parser.add_argument("--uploads", type=int, default=1, help="PDFs enviados por sessão antes das perguntas")
+    parser.add_argument("--paginas-pdf", type=int, default=10, help="páginas de cada PDF (com camada de texto)")
+    parser.add_argument("--tamanho-pdf", type=int, default=512, help="tamanho aproximado de cada PDF (KB)")
+    parser.add_argument("--perguntas-distintas", type=int, default=50,
+                        help="tamanho do conjunto de perguntas sorteadas (menor = mais repetições)")
+    parser.add_argument("--pausa", type=float, default=2.0, help="tempo médio (s) do usuário entre as perguntas")
+    parser.add_argument("--gemini", default="3,8,0.01", help="latência do Gemini: mediana,p95,taxa_falha")
+    parser.add_argument("--busca", default="0.4,1.2,0.005", help="latência do Vertex AI Search")
+    parser.add_argument("--upload", default="0.3,1,0.005", help="latência do upload ao GCS (sem a banda)")
+    parser.add_argument("--assinatura", default="0.002,0.005", help="latência da assinatura de uma URL")
+    parser.add_argument("--importacao", default="0.5,1.5", help="latência da importação no Data Store")
+    parser.add_argument("--banda-upload", type=float, default=20, help="banda de upload ao GCS (MB/s)")
+    parser.add_argument("--tokens-resposta", type=int, default=400, help="tokens de cada resposta do modelo")
+    parser.add_argument("--sem-limitadores", action="store_true",
+                        help="desativa os limitadores de taxa do servico_chat")
+    parser.add_argument("--http", action="store_true", help="passa pelo cliente_backend e pelo backend.py")
+    parser.add_argument("--porta", type=int, default=8765, help="porta local do backend no modo --http")
+    parser.add_argument("--semente", type=int, default=None, help="semente dos sorteios")
+    parser.add_argument("--logs", action="store_true", help="mantém os logs do app e das métricas")
+    return parser.parse_args()
+
+
+def _instalar_simuladores(args):
+    semente = args.semente
+    bucket = simuladores.BucketSimulado()
+    simuladores.instalar(
+        genai=simuladores.ClienteGenaiSimulado(simuladores.Latencia.de_texto(args.gemini, semente), args.tokens_resposta),
+        busca=simuladores.ClienteBuscaSimulado(simuladores.Latencia.de_texto(args.busca, semente), bucket),
+        documentos=simuladores.ClienteDocumentosSimulado(simuladores.Latencia.de_texto(args.importacao, semente), bucket),
+        storage=simuladores.ClienteStorageSimulado(
+            simuladores.Latencia.de_texto(args.upload, semente),
+            simuladores.Latencia.de_texto(args.assinatura, semente),
+            bucket,
+            banda_upload=args.banda_upload * 1024 * 1024,
+        ),
+    )
+    return bucket
+
+
+def _iniciar_backend(porta):
+    import uvicorn
+
+    import backend
+    import cliente_backend
+
+    # Com o token, o backend usa o usuário de cada sessão simulada no limite por usuário
+    backend.BACKEND_TOKEN = cliente_backend.BACKEND_TOKEN = uuid.uuid4().hex
+    servidor = uvicorn.Server(uvicorn.Config(backend.app, host="127.0.0.1", port=porta, log_level="warning"))
+    threading.Thread(target=servidor.run, name="backend-simulado", daemon=True).start()
+    while not servidor.started:
+        time.sleep(0.05)
+    cliente_backend.BACKEND_URL = f"http://127.0.0.1:{porta}"
+    return cliente_backend, servidor
+
+
+def _literal_pdf(texto):
+    return "(" + texto.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") + ")"
+
+
+@lru_cache(maxsize=4)
+def _conteudo_pdf(paginas, tamanho):
+    # PDF válido, com uma camada de texto por página (extraída pela verificação do upload e
+    # pelo índice local), completado até `tamanho` bytes com comentários nos conteúdos das
+    # páginas. Gerado uma vez e reaproveitado por todos os uploads
+    from pypdf import PdfWriter
+    from pypdf.generic import DecodedStreamObject, DictionaryObject, NameObject
+
+    writer = PdfWriter()
+    fonte = writer._add_object(DictionaryObject({
+        NameObject("/Type"): NameObject("/Font"),
+        NameObject("/Subtype"): NameObject("/Type1"),
+        NameObject("/BaseFont"): NameObject("/Helvetica"),
+        NameObject("/Encoding"): NameObject("/WinAnsiEncoding"),
+    }))
+    enchimento_por_pagina = max(0, tamanho // max(1, paginas) - 1024)
+    for numero in range(paginas):
+        linhas = [pergunta.format(n=numero) for pergunta in PERGUNTAS_BASE]
+        texto = " ".join(f"{_literal_pdf(linha)} Tj 0 -16 Td" for linha in linhas)
+        enchimento = "".join(f"% {os.urandom(38).hex()}\n" for _ in range(enchimento_por_pagina // 80))
+        conteudo = DecodedStreamObject()
+        conteudo.set_data(f"{enchimento}BT /F1 11 Tf 50 780 Td {texto} ET".encode("latin-1"))
+
+        pagina = writer.add_blank_page(595, 842)
+        pagina[NameObject("/Contents")] = writer._add_object(conteudo)
+        pagina[NameObject("/Resources")] = DictionaryObject({
+            NameObject("/Font"): DictionaryObject({NameObject("/F1"): fonte}),
+        })
+
+    saida = io.BytesIO()
+    writer.write(saida)
+    return saida.getvalue()
+
+
+def _pdf_simulado(paginas, tamanho):
+    return io.BytesIO(_conteudo_pdf(paginas, tamanho))
+
+
+class _Resultados:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.operacoes = Counter()
+        self.erros = Counter()
+
+    def registrar(self, operacao, erro=None):
+        with self._lock:
+            self.operacoes[operacao] += 1
+            if erro is not None:
+                self.erros[(operacao, type(erro).__name__)] += 1
+
+
+def _sessao(numero, servico, args, resultados):
+    # Reproduz o fluxo de uma sessão do main.py
+    aleatorio = random.Random(None if args.semente is None else args.semente + numero)
+    sessao_id = uuid.uuid4().hex
+    usuario = f"usuario{numero:03d}"
+    mensagens = []
+    estado_historico = {}
+
+    for indice in range(args.uploads):
+        nome = normalizar_nome_arquivo(f"Carga Sessão {numero} - Documento {indice}.pdf")
+        try:
+            with metricas.medir("sessao_upload"):
+                _, erros = servico.enviar_documentos([(_pdf_simulado(args.paginas_pdf, args.tamanho_pdf * 1024), nome)])
+            resultados.registrar("upload", RuntimeError(erros[nome]) if erros else None)
+        except Exception as e:
+            resultados.registrar("upload", e)
+
+    for _ in range(args.perguntas):
+        if args.pausa:
+            time.sleep(aleatorio.expovariate(1 / args.pausa))
+
+        pergunta = aleatorio.choice(PERGUNTAS_BASE).format(n=aleatorio.randrange(args.perguntas_distintas))
+        mensagens.append({"role": "user", "content": pergunta})
+        try:
+            with metricas.turno() as id_turno, metricas.medir("sessao_pergunta"):
+                resultado = servico.responder_pergunta(
+                    pergunta, mensagens[:-1], estado_historico, sessao_id, usuario, id_turno
+                )
+            mensagens.append({"role": "assistant", "content": resultado["resposta"]})
+            resultados.registrar("pergunta")
+        except LimiteExcedido as e:
+            resultados.registrar("pergunta", e)
+            mensagens.append({"role": "assistant", "content": f"⚠️ {e}"})
+        except Exception as e:
+            resultados.registrar("pergunta", e)
+            mensagens.append({"role": "assistant", "content": f"Ocorreu um erro ao gerar a resposta: {e}"})
+
+
+def _relatorio(args, duracao, resultados, bucket):
+    modo = "cliente_backend + backend.py" if args.http else "servico_chat (no processo)"
+    print(f"\n=== Teste de carga: {args.sessoes} sessões, {args.perguntas} perguntas e {args.uploads} upload(s) por sessão ===")
+    print(f"Modo: {modo} | limitadores: {'desativados' if args.sem_limitadores else 'ativos'} | duração: {duracao:.1f} s")
+
+    for operacao in ("upload", "pergunta"):
+        total = resultados.operacoes[operacao]
+        falhas = sum(v for (op, _), v in resultados.erros.items() if op == operacao)
+        print(f"{operacao:>10}: {total} ({falhas} com erro), {(total - falhas) / duracao:.2f}/s concluídos")
+    for (operacao, tipo), quantidade in sorted(resultados.erros.items()):
+        print(f"{'':>10}  erro em {operacao}: {tipo} x{quantidade}")
+
+    print(f"\n{'etapa':<30}{'p50 (ms)':>10}{'p95 (ms)':>10}{'p99 (ms)':>10}{'qtd':>8}")
+    for etapa, resumo in sorted(metricas.resumo_latencias().items()):
+        print(f"{etapa:<30}{resumo['p50'] * 1000:>10.1f}{resumo['p95'] * 1000:>10.1f}"
+              f"{resumo['p99'] * 1000:>10.1f}{resumo['contagem']:>8}")
+
+    print()
+    for nome, rotulos, valor in metricas.resumo_contadores():
+        descricao = ", ".join(f"{chave}={valor_rotulo}" for chave, valor_rotulo in rotulos.items())
+        print(f"{nome}{{{descricao}}}: {valor}")
+    print(f"documentos indexados no Data Store simulado: {len(bucket.documentos_indexados())}")
+
+
+def main():
+    args = _argumentos()
+
+    # O estado local do app (ex.: operacoes_importacao.json) é gravado num diretório temporário
+    os.chdir(tempfile.mkdtemp(prefix="simulacao_carga_"))
+    if not args.logs:
+        metricas.logger.setLevel(logging.WARNING)
+
+    bucket = _instalar_simuladores(args)
+
+    import servico_chat
+
+    if args.sem_limitadores:
+        servico_chat.limitador_usuarios = LimitadorTaxa(10 ** 9, 10 ** 9, servico_chat.ESPERA_MAXIMA_FILA)
+        servico_chat.limitador_global = LimitadorTaxa(10 ** 9, 10 ** 9, servico_chat.ESPERA_MAXIMA_FILA)
+
+    servico = servico_chat
+    if args.http:
+        servico, _ = _iniciar_backend(args.porta)
+
+    resultados = _Resultados()
+    inicio = time.perf_counter()
+    with redirect_stdout(sys.stdout if args.logs else io.StringIO()):
+        with ThreadPoolExecutor(max_workers=args.sessoes, thread_name_prefix="sessao") as executor:
+            for futuro in [executor.submit(_sessao, n, servico, args, resultados) for n in range(args.sessoes)]:
+                futuro.result()
+    duracao = time.perf_counter() - inicio
+
+    _relatorio(args, duracao, resultados, bucket)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+import hashlib
+import itertools
+import math
+import random
+import threading
+import time
+import zlib
+from types import SimpleNamespace
+
+from historico import estimar_tokens
+
+# Clientes simulados do Gemini (genai.Client), do Vertex AI Search (SearchServiceClient e
+# DocumentServiceClient) e do Cloud Storage (storage.Client), com latência e falhas
+# configuráveis. Substituem apenas os clientes: os tipos de requisição dos SDKs e todo o
+# código do app continuam sendo executados. Usados pelo simulacao_carga.py.
+
+
+class FalhaSimulada(Exception):
+    pass
+
+
+class TempoEsgotadoSimulado(FalhaSimulada):
+    pass
+
+
+class Latencia:
+    # Distribuição log-normal definida pela mediana e pelo p95 (segundos), com uma
+    # probabilidade `taxa_falha` de a chamada terminar em FalhaSimulada
+
+    def __init__(self, mediana, p95=None, taxa_falha=0.0, semente=None):
+        self.mediana = mediana
+        self.p95 = p95 if p95 is not None else mediana
+        self.taxa_falha = taxa_falha
+        self._mu = math.log(mediana) if mediana > 0 else None
+        self._sigma = math.log(self.p95 / mediana) / 1.645 if mediana > 0 and self.p95 > mediana else 0.0
+        self._aleatorio = random.Random(semente)
+
+    @classmethod
+    def de_texto(cls, texto, semente=None):
+        # "mediana[,p95[,taxa_falha]]", ex.: "2.5,8,0.01"
+        valores = [float(v) for v in texto.split(",")]
+        return cls(*valores[:3], semente=semente)
+
+    def amostrar(self):
+        if self._mu is None:
+            return 0.0
+        return self._aleatorio.lognormvariate(self._mu, self._sigma)
+
+    def aplicar(self, operacao, extra=0.0, timeout=None):
+        # Aguarda a latência sorteada (mais `extra` segundos) e eventualmente falha;
+        # com `timeout`, desiste depois desse tempo como a chamada real
+        duracao = self.amostrar() + extra
+        if timeout is not None and duracao > timeout:
+            time.sleep(timeout)
+            raise TempoEsgotadoSimulado(f"Tempo esgotado em {operacao} ({timeout:.1f} s)")
+        time.sleep(duracao)
+        if self.taxa_falha and self._aleatorio.random() < self.taxa_falha:
+            raise FalhaSimulada(f"Falha simulada em {operacao}")
+
+    def __repr__(self):
+        return f"Latencia(mediana={self.mediana}s, p95={self.p95}s, falha={self.taxa_falha:.1%})"
+
+
+class BucketSimulado:
+    # Estado compartilhado entre os simuladores: objetos enviados ao bucket e documentos
+    # já indexados no Data Store (apenas estes aparecem nas buscas)
+
+    def __init__(self, bucket=None, documentos_iniciais=200):
+        from processastorage import BUCKET_ARQUIVOS
+
+        self.bucket = bucket or BUCKET_ARQUIVOS
+        self._lock = threading.Lock()
+        self.objetos = {}
+        self.indexados = [f"gs://{self.bucket}/documento_{i:04d}.pdf" for i in range(documentos_iniciais)]
+
+    def gravar(self, bucket, nome, tamanho):
+        with self._lock:
+            self.objetos[f"gs://{bucket}/{nome}"] = tamanho
+
+    def indexar(self, uris):
+        with self._lock:
+            for uri in uris:
+                if uri.endswith("/*"):
+                    novos = [o for o in self.objetos if o.startswith(uri[:-1])]
+                else:
+                    novos = [uri]
+                self.indexados.extend(u for u in novos if u not in self.indexados)
+
+    def desindexar(self, uri):
+        with self._lock:
+            if uri in self.indexados:
+                self.indexados.remove(uri)
+
+    def remover(self, bucket, nome):
+        with self._lock:
+            if self.objetos.pop(f"gs://{bucket}/{nome}", None) is None:
+                raise FalhaSimulada(f"Objeto inexistente: gs://{bucket}/{nome}")
+
+    def listar(self, bucket, prefixo):
+        with self._lock:
+            inicio = f"gs://{bucket}/{prefixo}"
+            return [uri[len(f"gs://{bucket}/"):] for uri in self.objetos if uri.startswith(inicio)]
+
+    def documentos_indexados(self):
+        with self._lock:
+            return list(self.indexados)
+
+
+class _ModelosSimulados:
+    def __init__(self, latencia, tokens_resposta):
+        self._latencia = latencia
+        self._tokens_resposta = tokens_resposta
+
+    @staticmethod
+    def _textos(conteudo):
+        if conteudo is None:
+            return []
+        if isinstance(conteudo, str):
+            return [conteudo]
+        if isinstance(conteudo, (list, tuple)):
+            return [texto for item in conteudo for texto in _ModelosSimulados._textos(item)]
+        if getattr(conteudo, "parts", None) is not None:
+            return _ModelosSimulados._textos(conteudo.parts)
+        return [conteudo.text or ""] if getattr(conteudo, "text", None) is not None else []
+
+    def generate_content(self, model, contents, config=None):
+        textos = self._textos(contents) + self._textos(getattr(config, "system_instruction", None))
+        tokens_prompt = sum(estimar_tokens(texto) for texto in textos)
+
+        limite = getattr(config, "max_output_tokens", None) or self._tokens_resposta
+        tokens_resposta = min(self._tokens_resposta, limite)
+        self._latencia.aplicar("generate_content")
+
+        texto = " ".join(itertools.islice(itertools.cycle(["Resposta", "simulada", "do", "modelo."]), tokens_resposta))
+        return SimpleNamespace(
+            text=texto,
+            candidates=[SimpleNamespace(content=SimpleNamespace(parts=[SimpleNamespace(text=texto)]))],
+            usage_metadata=SimpleNamespace(prompt_token_count=tokens_prompt, candidates_token_count=tokens_resposta),
+        )
+
+
+class ClienteGenaiSimulado:
+    # Substitui genai.Client: apenas `models.generate_content` é usado pelo chatvertex
+    def __init__(self, latencia, tokens_resposta=400):
+        self.models = _ModelosSimulados(latencia, tokens_resposta)
+
+
+class ClienteBuscaSimulado:
+    # Substitui discoveryengine.SearchServiceClient; a mesma consulta sempre retorna os mesmos documentos
+    def __init__(self, latencia, bucket_simulado):
+        self._latencia = latencia
+        self._bucket = bucket_simulado
+
+    def search(self, request, timeout=None):
+        self._latencia.aplicar("search", timeout=timeout)
+
+        documentos = self._bucket.documentos_indexados()
+        aleatorio = random.Random(zlib.crc32(request.query.encode("utf-8")))
+        escolhidos = aleatorio.sample(documentos, min(request.page_size or 10, len(documentos)))
+
+        max_segmentos = request.content_search_spec.extractive_content_spec.max_extractive_segment_count
+        resultados = []
+        for posicao, link in enumerate(escolhidos):
+            titulo = link.rsplit("/", 1)[-1]
+            dados = {
+                "link": link,
+                "title": titulo,
+                "snippets": [{"snippet": f"Trecho de {titulo} relacionado a: {request.query}"}],
+                "extractive_segments": [
+                    {"content": f"Segmento {i + 1} de {titulo}. " * 20} for i in range(max_segmentos)
+                ],
+            }
+            resultados.append(SimpleNamespace(
+                document=SimpleNamespace(derived_struct_data=dados),
+                model_scores={"relevance_score": SimpleNamespace(values=[1 - posicao / (len(escolhidos) + 1)])},
+            ))
+        return SimpleNamespace(results=resultados, next_page_token="")
+
+
+class ClienteDocumentosSimulado:
+    # Substitui discoveryengine.DocumentServiceClient: a importação conclui na hora e
+    # torna os documentos pesquisáveis; a remoção os retira das buscas
+    def __init__(self, latencia, bucket_simulado):
+        self._latencia = latencia
+        self._bucket = bucket_simulado
+        self._sequencia = itertools.count(1)
+
+    def branch_path(self, project, location, data_store, branch):
+        return f"projects/{project}/locations/{location}/dataStores/{data_store}/branches/{branch}"
+
+    def import_documents(self, request):
+        self._latencia.aplicar("import_documents")
+        self._bucket.indexar(list(request.gcs_source.input_uris))
+        nome = f"{request.parent}/operations/importacao-simulada-{next(self._sequencia)}"
+        return SimpleNamespace(operation=SimpleNamespace(name=nome))
+
+    def get_operation(self, request):
+        return SimpleNamespace(done=True, error=SimpleNamespace(message=""), HasField=lambda campo: False)
+
+    def list_documents(self, parent):
+        self._latencia.aplicar("list_documents")
+        return [SimpleNamespace(name=f"{parent}/documents/{hashlib.md5(uri.encode()).hexdigest()}",
+                                content=SimpleNamespace(uri=uri))
+                for uri in self._bucket.documentos_indexados()]
+
+    def delete_document(self, name):
+        self._latencia.aplicar("delete_document")
+        identificador = name.rsplit("/", 1)[-1]
+        for uri in self._bucket.documentos_indexados():
+            if hashlib.md5(uri.encode()).hexdigest() == identificador:
+                self._bucket.desindexar(uri)
+                return
+        raise FalhaSimulada(f"Documento inexistente: {name}")
+
+
+class _BlobSimulado:
+    def __init__(self, cliente, bucket, nome):
+        self._cliente = cliente
+        self.bucket = bucket
+        self.name = nome
+
+    def upload_from_file(self, arquivo, rewind=False, content_type=None):
+        if rewind:
+            arquivo.seek(0)
+        tamanho = len(arquivo.read())
+        self._cliente.latencia_upload.aplicar("upload_from_file", tamanho / self._cliente.banda_upload)
+        self._cliente.bucket_simulado.gravar(self.bucket, self.name, tamanho)
+
+    def upload_from_filename(self, caminho):
+        with open(caminho, "rb") as arquivo:
+            self.upload_from_file(arquivo)
+
+    def delete(self):
+        self._cliente.latencia_upload.aplicar("delete")
+        self._cliente.bucket_simulado.remover(self.bucket, self.name)
+
+    def generate_signed_url(self, expiration, credentials=None, **kwargs):
+        self._cliente.latencia_assinatura.aplicar("generate_signed_url")
+        return (f"https://storage.googleapis.com/{self.bucket}/{self.name}"
+                f"?X-Goog-Expires={int(expiration.timestamp())}&X-Goog-Signature=simulada")
+
+
+class ClienteStorageSimulado:
+    # Substitui storage.Client; `banda_upload` em bytes por segundo soma-se à latência do upload
+    def __init__(self, latencia_upload, latencia_assinatura, bucket_simulado, banda_upload=20 * 1024 * 1024):
+        self.latencia_upload = latencia_upload
+        self.latencia_assinatura = latencia_assinatura
+        self.bucket_simulado = bucket_simulado
+        self.banda_upload = banda_upload
+
+    def bucket(self, nome):
+        return SimpleNamespace(name=nome, blob=lambda nome_blob: _BlobSimulado(self, nome, nome_blob))
+
+    def list_blobs(self, nome_bucket, prefix=None):
+        self.latencia_upload.aplicar("list_blobs")
+        return [_BlobSimulado(self, nome_bucket, nome) for nome in self.bucket_simulado.listar(nome_bucket, prefix or "")]
+
+
+def instalar(genai=None, busca=None, documentos=None, storage=None):
+    # Troca os clientes compartilhados dos módulos do app pelos simuladores informados
+    import buscar_documentos
+    import chatvertex
+    import importdocdatastore
+    import processastorage
+
+    if genai is not None:
+        chatvertex._obter_cliente_genai = lambda: genai
+    if busca is not None:
+        buscar_documentos._obter_cliente_busca = lambda location: busca
+        buscar_documentos.limpar_cache_busca()
+    if documentos is not None:
+        importdocdatastore._obter_cliente_documentos = lambda: documentos
+    if storage is not None:
+        processastorage._obter_cliente_storage = lambda: storage
+        # A assinatura simulada não usa a chave da service account
+        processastorage._obter_credenciais = lambda: None
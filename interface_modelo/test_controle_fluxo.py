@@ -0,0 +1,103 @@
+import threading
+import time
+
+import pytest
+
+import controle_fluxo
+from controle_fluxo import BaldeTokens, ChamadaUnica, LimiteExcedido, LimitadorTaxa
+
+
+@pytest.fixture
+def relogio(monkeypatch):
+    agora = [1000.0]
+    monkeypatch.setattr(controle_fluxo.time, "monotonic", lambda: agora[0])
+    return agora
+
+
+def test_balde_acumula_a_espera_de_quem_reservou():
+    balde = BaldeTokens(taxa_por_segundo=1, capacidade=2, agora=0)
+
+    assert balde.espera(0) == 0
+    balde.reservar(0)
+    balde.reservar(0)
+    assert balde.espera(0) == 1.0
+    balde.reservar(0)
+    assert balde.espera(0) == 2.0
+    assert balde.espera(2) == 0
+    assert not balde.cheio(2) and balde.cheio(3)
+
+
+def test_limitador_retorna_a_espera_e_recusa_acima_do_maximo(relogio):
+    limitador = LimitadorTaxa(taxa_por_minuto=60, capacidade=2, espera_maxima=1.5)
+
+    assert [limitador.reservar("ana") for _ in range(3)] == [0, 0, 1.0]
+    with pytest.raises(LimiteExcedido) as erro:
+        limitador.reservar("ana")
+    assert erro.value.espera == 2.0
+
+    # Cada chave tem o próprio balde
+    assert limitador.reservar("bia") == 0
+
+    relogio[0] += 2
+    assert limitador.reservar("ana") == 0
+
+
+def test_tentar_adquirir_nao_entra_na_fila(relogio):
+    limitador = LimitadorTaxa(taxa_por_minuto=60, capacidade=1, espera_maxima=30)
+
+    assert limitador.tentar_adquirir()
+    assert not limitador.tentar_adquirir()
+    relogio[0] += 0.5
+    assert not limitador.tentar_adquirir()
+    relogio[0] += 0.5
+    assert limitador.tentar_adquirir()
+
+
+def test_devolver_libera_a_vaga_reservada(relogio):
+    limitador = LimitadorTaxa(taxa_por_minuto=60, capacidade=1, espera_maxima=30)
+
+    limitador.reservar("ana")
+    limitador.devolver("ana")
+    assert limitador.tentar_adquirir("ana")
+
+
+def test_limitadores_com_o_mesmo_arquivo_compartilham_os_baldes(tmp_path):
+    arquivo = str(tmp_path / "limites.json")
+    primeiro = LimitadorTaxa(taxa_por_minuto=1, capacidade=1, espera_maxima=30, arquivo=arquivo)
+    segundo = LimitadorTaxa(taxa_por_minuto=1, capacidade=1, espera_maxima=30, arquivo=arquivo)
+
+    assert primeiro.tentar_adquirir("ana")
+    assert not segundo.tentar_adquirir("ana")
+    assert segundo.tentar_adquirir("bia")
+
+
+def test_erro_de_quem_executa_chega_a_quem_aguarda():
+    chamada = ChamadaUnica()
+    iniciada = threading.Event()
+    liberar = threading.Event()
+    erros = []
+
+    def lider():
+        iniciada.set()
+        liberar.wait(5)
+        raise ValueError("falha na chamada")
+
+    def chamar(funcao):
+        try:
+            chamada.executar("chave", funcao)
+        except ValueError as e:
+            erros.append(e)
+
+    thread_lider = threading.Thread(target=chamar, args=(lider,))
+    thread_lider.start()
+    iniciada.wait(5)
+    thread_seguidor = threading.Thread(target=chamar, args=(lambda: "executada de novo",))
+    thread_seguidor.start()
+    time.sleep(0.1)
+    liberar.set()
+    thread_lider.join(5)
+    thread_seguidor.join(5)
+
+    assert [str(e) for e in erros] == ["falha na chamada"] * 2
+    # A chave é liberada: a próxima chamada executa de novo
+    assert chamada.executar("chave", lambda: "ok") == ("ok", False)
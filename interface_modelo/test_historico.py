@@ -0,0 +1,79 @@
+from historico import (
+    ORCAMENTO_TOKENS_HISTORICO, ORCAMENTO_TOKENS_RESUMO, TURNOS_VERBATIM, estimar_tokens, limpar_mensagem,
+    preparar_historico
+)
+
+# Blocos no formato gerado por servico_chat.formatar_documentos
+BLOCO_DOCUMENTOS = ("\n\n**Documentos relacionados:**\n"
+                    "- [contrato.pdf](https://storage.googleapis.com/bucket/contrato.pdf?X-Goog-Signature=abc)\n"
+                    "- [anexo.pdf](https://storage.googleapis.com/bucket/anexo.pdf?X-Goog-Signature=def)")
+BLOCO_SEM_DOCUMENTOS = "\n\n_Nenhum documento relacionado encontrado._"
+
+
+def test_remove_bloco_de_documentos():
+    resposta = "O prazo é de 30 dias." + BLOCO_DOCUMENTOS
+
+    assert limpar_mensagem({"role": "assistant", "content": resposta}) == "O prazo é de 30 dias."
+
+
+def test_remove_aviso_sem_documentos():
+    resposta = "Não encontrei a informação." + BLOCO_SEM_DOCUMENTOS
+
+    assert limpar_mensagem({"role": "assistant", "content": resposta}) == "Não encontrei a informação."
+
+
+def test_mantem_mencao_a_documentos_relacionados_no_texto():
+    resposta = "Veja os documentos relacionados ao contrato principal: o prazo é de 30 dias."
+
+    assert limpar_mensagem({"role": "assistant", "content": resposta}) == resposta
+    assert limpar_mensagem({"role": "assistant", "content": resposta + BLOCO_DOCUMENTOS}) == resposta
+
+
+def test_so_resume_quando_as_mensagens_antigas_passam_do_orcamento():
+    chamadas = []
+
+    def resumir(resumo, mensagens, orcamento):
+        chamadas.append(list(mensagens))
+        return "resumo"
+
+    estado = {}
+    mensagens = [{"role": "user" if i % 2 == 0 else "assistant", "content": f"mensagem {i}"}
+                 for i in range(TURNOS_VERBATIM * 2 + 2)]
+    resumo, historico = preparar_historico(mensagens, estado, resumir)
+    assert (resumo, len(historico), chamadas) == ("", len(mensagens), [])
+
+    mensagens[0]["content"] = "x" * (ORCAMENTO_TOKENS_RESUMO * 4 + 4)
+    resumo, historico = preparar_historico(mensagens, estado, resumir)
+    assert resumo == "resumo"
+    assert len(historico) == TURNOS_VERBATIM * 2
+    assert len(chamadas) == 1 and len(chamadas[0]) == 2
+    assert estado["mensagens_resumidas"] == 2
+
+
+def test_respostas_longas_saem_da_janela_para_caber_no_orcamento_total():
+    chamadas = []
+
+    def resumir(resumo, mensagens, orcamento):
+        chamadas.append(list(mensagens))
+        return "resumo"
+
+    def tokens(resumo, historico):
+        return estimar_tokens(resumo) + sum(estimar_tokens(f"{papel}: {texto}") for papel, texto in historico)
+
+    # Cada resposta longa cabe sozinha no orçamento, mas duas não
+    resposta_longa = "r" * (ORCAMENTO_TOKENS_HISTORICO * 3)
+    mensagens = [{"role": "user", "content": "pergunta 1"}, {"role": "assistant", "content": resposta_longa},
+                 {"role": "user", "content": "pergunta 2"}, {"role": "assistant", "content": resposta_longa},
+                 {"role": "user", "content": "pergunta 3"}, {"role": "assistant", "content": "resposta curta"}]
+    resumo, historico = preparar_historico(mensagens, {}, resumir)
+    assert tokens(resumo, historico) <= ORCAMENTO_TOKENS_HISTORICO
+    assert historico == [("user", "pergunta 2"), ("model", resposta_longa),
+                         ("user", "pergunta 3"), ("model", "resposta curta")]
+    assert resumo == "resumo" and len(chamadas[0]) == 2
+
+    # A última resposta, sozinha maior que o orçamento, é cortada
+    mensagens.append({"role": "user", "content": "pergunta 4"})
+    mensagens.append({"role": "assistant", "content": "x" * (ORCAMENTO_TOKENS_HISTORICO * 8)})
+    resumo, historico = preparar_historico(mensagens, {}, lambda *args: None)
+    assert tokens(resumo, historico) <= ORCAMENTO_TOKENS_HISTORICO
+    assert [papel for papel, _ in historico][-1] == "model"
@@ -0,0 +1,48 @@
+import pytest
+
+import importdocdatastore
+from importdocdatastore import MAX_TENTATIVAS_IMPORTACAO, agendar_indexacao, indexar_pendentes
+
+
+@pytest.fixture
+def fila(tmp_path, monkeypatch):
+    monkeypatch.setattr(importdocdatastore, "ARQUIVO_FILA_INDEXACAO", str(tmp_path / "fila_indexacao.json"))
+    monkeypatch.setattr(importdocdatastore, "_armar_temporizador", lambda espera: None)
+    return importdocdatastore._ler_fila
+
+
+def test_uri_descartada_apos_o_maximo_de_tentativas(fila, monkeypatch):
+    def importar(uris):
+        raise RuntimeError("Data Store indisponível")
+
+    monkeypatch.setattr(importdocdatastore, "_importar", importar)
+    agendar_indexacao(["gs://bucket/contrato.pdf"])
+
+    for tentativa in range(1, MAX_TENTATIVAS_IMPORTACAO):
+        with pytest.raises(RuntimeError):
+            indexar_pendentes()
+        assert fila()["reenvios"]["gs://bucket/contrato.pdf"][0] == tentativa
+        assert "gs://bucket/contrato.pdf" in fila()["pendentes"]
+
+    with pytest.raises(RuntimeError):
+        indexar_pendentes()
+    assert fila()["pendentes"] == {}
+    assert fila()["reenvios"] == {}
+
+
+def test_apenas_os_lotes_com_falha_voltam_para_a_fila(fila, monkeypatch):
+    monkeypatch.setattr(importdocdatastore, "MAX_URIS_POR_IMPORTACAO", 1)
+    submetidas = []
+
+    def importar(uris):
+        if uris == ["gs://bucket/falha.pdf"]:
+            raise RuntimeError("falha no lote")
+        submetidas.extend(uris)
+
+    monkeypatch.setattr(importdocdatastore, "_importar", importar)
+    agendar_indexacao(["gs://bucket/ok.pdf", "gs://bucket/falha.pdf"])
+
+    assert indexar_pendentes() == 1
+    assert submetidas == ["gs://bucket/ok.pdf"]
+    assert list(fila()["pendentes"]) == ["gs://bucket/falha.pdf"]
+    assert fila()["reenvios"]["gs://bucket/falha.pdf"][0] == 1
@@ -0,0 +1,41 @@
+import os
+
+from indice_lexical import FATOR_FUSAO, IndiceLexical
+
+
+def _arquivos_de_segmento(diretorio):
+    return sorted(nome for nome in os.listdir(diretorio) if nome.endswith(".texto"))
+
+
+def test_fusao_de_camada_seguida_de_remocao(tmp_path):
+    indice = IndiceLexical(str(tmp_path))
+    uris = [f"gs://bucket/contrato_{i}.pdf" for i in range(FATOR_FUSAO)]
+
+    # Cada adição cria um segmento pequeno; ao encher a camada, eles são fundidos num só
+    for numero, uri in enumerate(uris):
+        indice.adicionar([(uri, f"contrato {numero} clausula de rescisao e multa por atraso")])
+    assert len(indice._manifesto["segmentos"]) == 1
+    assert len(_arquivos_de_segmento(tmp_path)) == 1
+    assert indice.quantidade() == FATOR_FUSAO
+
+    assert indice.remover(uris[:2]) == 2
+    assert indice.quantidade() == FATOR_FUSAO - 2
+    assert sorted(r["link"] for r in indice.buscar("rescisao")) == uris[2:]
+
+    # Sem documentos vivos, o segmento fundido é apagado
+    assert indice.remover(uris[2:]) == 2
+    assert indice.buscar("rescisao") == []
+    assert indice._manifesto["segmentos"] == []
+    assert _arquivos_de_segmento(tmp_path) == []
+
+
+def test_reenvio_apos_fusao_mantem_apenas_a_versao_nova(tmp_path):
+    indice = IndiceLexical(str(tmp_path))
+    for numero in range(FATOR_FUSAO):
+        indice.adicionar([(f"gs://bucket/doc_{numero}.pdf", f"versao antiga documento {numero}")])
+
+    indice.adicionar([("gs://bucket/doc_0.pdf", "versao nova documento 0")])
+
+    assert indice.quantidade() == FATOR_FUSAO
+    assert [r["link"] for r in indice.buscar("nova")] == ["gs://bucket/doc_0.pdf"]
+    assert "gs://bucket/doc_0.pdf" not in [r["link"] for r in indice.buscar("antiga")]